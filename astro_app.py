@@ -1,196 +1,85 @@
 import streamlit as st
-import requests
 from streamlit_geolocation import streamlit_geolocation
-import math
-import time
 from datetime import datetime
 import pytz
 from timezonefinder import TimezoneFinder
+import cProfile
+import io
+import math
+import pstats
+import time
 import urllib.parse
 
-# --- データ定義 (ユーザー提供のデータに全面的に刷新・最大限追加) ---
-SPOTS = [
-    # 北海道
-    {"name": "名寄市（北海道）- なよろ市立天文台", "lat": 44.3533, "lon": 142.4862, "sqm_level": 20.98},
-    {"name": "伊達市（北海道）- 北湯沢温泉", "lat": 42.6698, "lon": 140.9233, "sqm_level": 21.02},
-    {"name": "斜里町（北海道）- 知床国立公園", "lat": 44.0768, "lon": 144.8561, "sqm_level": 21.84},
-    {"name": "陸別町（北海道）- 銀河の森天文台", "lat": 43.4682, "lon": 143.7630, "sqm_level": 21.72},
-    {"name": "弟子屈町（北海道）- 摩周湖", "lat": 43.5850, "lon": 144.5222, "sqm_level": 21.90},
-
-    # 東北
-    {"name": "八戸市（青森県）- 種差海岸", "lat": 40.5233, "lon": 141.5658, "sqm_level": 19.64},
-    {"name": "二戸市（岩手県）- 古橋児童公園", "lat": 40.2647, "lon": 141.3039, "sqm_level": 20.42},
-    {"name": "仙台市青葉区（宮城県）- 大倉ダム", "lat": 38.3094, "lon": 140.7075, "sqm_level": 19.71},
-    {"name": "朝日町（山形県）- Asahi自然観", "lat": 38.3752, "lon": 140.0911, "sqm_level": 21.05},
-    {"name": "田村市（福島県）- 星の村天文台", "lat": 37.3621, "lon": 140.6756, "sqm_level": 20.87},
-    {"name": "いわき市（福島県）- いわき市中央台鹿島", "lat": 37.0160, "lon": 140.8930, "sqm_level": 19.40},
-    {"name": "白河市（福島県）- 白河関の森公園", "lat": 37.0664, "lon": 140.1983, "sqm_level": 20.46},
-    {"name": "広野町（福島県）- SUZUKI天体観測所", "lat": 37.2223, "lon": 141.0097, "sqm_level": 20.71},
-
-    # 関東
-    {"name": "つくば市（茨城県）- 吾妻", "lat": 36.0833, "lon": 140.1118, "sqm_level": 18.36},
-    {"name": "常陸大宮市（茨城県）- 花立自然公園", "lat": 36.6369, "lon": 140.4578, "sqm_level": 20.60},
-    {"name": "佐野市（栃木県）- 作原自然環境保全地域", "lat": 36.4259, "lon": 139.5161, "sqm_level": 20.52},
-    {"name": "高山村（群馬県）- ぐんま天文台", "lat": 36.6331, "lon": 138.9631, "sqm_level": 20.31},
-    {"name": "玉村町（群馬県）- 道の駅玉村宿", "lat": 36.3108, "lon": 139.1175, "sqm_level": 15.93},
-    {"name": "さいたま市緑区（埼玉県）- 浦和美園4丁目公園", "lat": 35.9126, "lon": 139.7226, "sqm_level": 17.27},
-    {"name": "草加市（埼玉県）- 谷塚駅前", "lat": 35.8086, "lon": 139.8003, "sqm_level": 17.53},
-    {"name": "松戸市（千葉県）", "lat": 35.7876, "lon": 139.9043, "sqm_level": 17.46},
-    {"name": "佐倉市（千葉県）", "lat": 35.7208, "lon": 140.2311, "sqm_level": 18.67},
-    {"name": "習志野市（千葉県）- 谷津奏の杜公園", "lat": 35.6723, "lon": 140.0150, "sqm_level": 15.14},
-    {"name": "八千代市（千葉県）", "lat": 35.7256, "lon": 140.1008, "sqm_level": 18.22},
-    {"name": "鴨川市（千葉県）", "lat": 35.1158, "lon": 139.9022, "sqm_level": 20.20},
-    {"name": "君津市（千葉県）", "lat": 35.3308, "lon": 139.8944, "sqm_level": 17.43},
-    {"name": "いすみ市（千葉県）", "lat": 35.2573, "lon": 140.3159, "sqm_level": 19.90},
-    {"name": "奥多摩町（東京都）- 奥多摩湖大麦代園地駐車場", "lat": 35.7905, "lon": 139.0069, "sqm_level": 20.41},
-    {"name": "神津島村（東京都）- 赤崎遊歩道", "lat": 34.2375, "lon": 139.1328, "sqm_level": 21.21},
-    {"name": "小笠原村（東京都）- コペペ海岸", "lat": 27.0800, "lon": 142.1952, "sqm_level": 21.47},
-    {"name": "三鷹市（東京都）- 三鷹市大沢", "lat": 35.6748, "lon": 139.5414, "sqm_level": 17.18},
-    {"name": "小金井市（東京都）- 都立小金井公園", "lat": 35.7163, "lon": 139.5126, "sqm_level": 16.66},
-    {"name": "羽村市（東京都）", "lat": 35.7621, "lon": 139.3103, "sqm_level": 17.89},
-    {"name": "清川村（神奈川県）- 宮ヶ瀬湖畔", "lat": 35.5333, "lon": 139.2333, "sqm_level": 19.47},
-    {"name": "相模原市中央区（神奈川県）- 下溝", "lat": 35.5284, "lon": 139.3872, "sqm_level": 17.72},
-    {"name": "藤沢市（神奈川県）", "lat": 35.3396, "lon": 139.4893, "sqm_level": 16.86},
-
-    # 中部
-    {"name": "新潟市北区（新潟県）", "lat": 37.9157, "lon": 139.1171, "sqm_level": 19.52},
-    {"name": "佐渡市（新潟県）- 大野亀", "lat": 38.2253, "lon": 138.4117, "sqm_level": 21.46},
-    {"name": "胎内市（新潟県）- 胎内自然天文館", "lat": 38.0553, "lon": 139.5011, "sqm_level": 21.18},
-    {"name": "富山市（富山県）- 古洞ダム", "lat": 36.6300, "lon": 137.1519, "sqm_level": 19.43},
-    {"name": "金沢市（石川県）", "lat": 36.5611, "lon": 136.6566, "sqm_level": 17.99},
-    {"name": "かほく市（石川県）", "lat": 36.7208, "lon": 136.7025, "sqm_level": 19.20},
-    {"name": "能登町（石川県）- 満天星", "lat": 37.3197, "lon": 137.0707, "sqm_level": 20.78},
-    {"name": "小浜市（福井県）", "lat": 35.4958, "lon": 135.7453, "sqm_level": 20.17},
-    {"name": "大野市（福井県）- 福井県自然保護センター", "lat": 35.9189, "lon": 136.6203, "sqm_level": 20.86},
-    {"name": "おおい町（福井県）- 名田庄", "lat": 35.4182, "lon": 135.6888, "sqm_level": 21.58},
-    {"name": "富士吉田市（山梨県）- 富士北麓公園", "lat": 35.4678, "lon": 138.8028, "sqm_level": 19.18},
-    {"name": "北杜市（山梨県）- 白州町", "lat": 35.8361, "lon": 138.3308, "sqm_level": 10.46},
-    {"name": "富士河口湖町（山梨県）- 大石公園", "lat": 35.5186, "lon": 138.7569, "sqm_level": 20.26},
-    {"name": "小菅村（山梨県）- ヘリポート", "lat": 35.8428, "lon": 139.0067, "sqm_level": 20.80},
-    {"name": "丹波山村（山梨県）", "lat": 35.8564, "lon": 138.9508, "sqm_level": 20.90},
-    {"name": "松本市（長野県）- 乗鞍高原いがや", "lat": 36.1264, "lon": 137.6652, "sqm_level": 21.30},
-    {"name": "上田市（長野県）", "lat": 36.4019, "lon": 138.2531, "sqm_level": 20.26},
-    {"name": "岡谷市（長野県）- 塩嶺王城パークライン", "lat": 36.0463, "lon": 138.0163, "sqm_level": 19.02},
-    {"name": "飯田市（長野県）", "lat": 35.5161, "lon": 137.8228, "sqm_level": 21.11},
-    {"name": "諏訪市（長野県）- 霧ヶ峰自然保護センター", "lat": 36.0963, "lon": 138.2001, "sqm_level": 20.68},
-    {"name": "小諸市（長野県）", "lat": 36.3267, "lon": 138.4231, "sqm_level": 20.06},
-    {"name": "伊那市（長野県）- 西春近北小学校", "lat": 35.8119, "lon": 137.9575, "sqm_level": 20.22},
-    {"name": "駒ヶ根市（長野県）- アルプスの丘", "lat": 35.7289, "lon": 137.8932, "sqm_level": 21.78},
-    {"name": "茅野市（長野県）", "lat": 35.9939, "lon": 138.1561, "sqm_level": 21.00},
-    {"name": "塩尻市（長野県）- 奈良井ダム", "lat": 35.9869, "lon": 137.7819, "sqm_level": 20.77},
-    {"name": "佐久市（長野県）", "lat": 36.2514, "lon": 138.4739, "sqm_level": 20.10},
-    {"name": "千曲市（長野県）- 中央公園", "lat": 36.4678, "lon": 138.1206, "sqm_level": 20.65},
-    {"name": "東御市（長野県）", "lat": 36.3572, "lon": 138.3314, "sqm_level": 19.62},
-    {"name": "南牧村（長野県）- 野辺山", "lat": 35.9575, "lon": 138.4770, "sqm_level": 20.51},
-    {"name": "北相木村（長野県）- 栃原", "lat": 36.0353, "lon": 138.5619, "sqm_level": 21.18},
-    {"name": "下諏訪町（長野県）- 八島湿原", "lat": 36.1167, "lon": 138.1333, "sqm_level": 20.62},
-    {"name": "原村（長野県）- 八ヶ岳自然文化園", "lat": 35.9594, "lon": 138.2522, "sqm_level": 20.77},
-    {"name": "箕輪町（長野県）- 箕輪北小学校", "lat": 35.9328, "lon": 137.9869, "sqm_level": 20.25},
-    {"name": "南箕輪村（長野県）", "lat": 35.8894, "lon": 137.9839, "sqm_level": 20.29},
-    {"name": "阿智村（長野県）- 伍和栗矢観測所", "lat": 35.4594, "lon": 137.7885, "sqm_level": 20.67},
-    {"name": "下條村（長野県）", "lat": 35.4182, "lon": 137.8427, "sqm_level": 20.63},
-    {"name": "大鹿村（長野県）", "lat": 35.5398, "lon": 138.0805, "sqm_level": 21.63},
-    {"name": "木祖村（長野県）- 東京大学木曽観測所", "lat": 35.9750, "lon": 137.6433, "sqm_level": 20.53},
-    {"name": "王滝村（長野県）", "lat": 35.8617, "lon": 137.5583, "sqm_level": 20.74},
-    {"name": "木曽町（長野県）- 木曽馬の里", "lat": 35.8821, "lon": 137.6256, "sqm_level": 21.71},
-    {"name": "山形村（長野県）- ミラードーム", "lat": 36.1667, "lon": 137.8833, "sqm_level": 19.88},
-    {"name": "朝日村（長野県）- 朝日小学校", "lat": 36.1436, "lon": 137.8467, "sqm_level": 20.50},
-    {"name": "坂城町（長野県）", "lat": 36.4528, "lon": 138.1883, "sqm_level": 19.80},
-    {"name": "揖斐川町（岐阜県）- 西横山", "lat": 35.5645, "lon": 136.4719, "sqm_level": 20.56},
-    {"name": "可児市（岐阜県）- 可児市天文台", "lat": 35.4150, "lon": 137.0658, "sqm_level": 18.23},
-    {"name": "清水町（静岡県）", "lat": 35.1017, "lon": 138.9056, "sqm_level": 18.22},
-
-    # 近畿
-    {"name": "名古屋市中区（愛知県）- 名古屋市科学館", "lat": 35.1681, "lon": 136.8990, "sqm_level": 16.30},
-    {"name": "豊田市（愛知県）", "lat": 35.0833, "lon": 137.1500, "sqm_level": 20.31},
-    {"name": "新城市（愛知県）", "lat": 34.9000, "lon": 137.5000, "sqm_level": 20.10},
-    {"name": "設楽町（愛知県）- つぐ高原グリーンパーク", "lat": 35.1983, "lon": 137.5684, "sqm_level": 20.68},
-    {"name": "東栄町（愛知県）", "lat": 35.0667, "lon": 137.6667, "sqm_level": 20.59},
-    {"name": "豊根村（愛知県）- 茶臼山高原", "lat": 35.2223, "lon": 137.6610, "sqm_level": 20.62},
-    {"name": "亀山市（三重県）- 鈴鹿馬子唄の里自然の家", "lat": 34.8770, "lon": 136.3533, "sqm_level": 19.68},
-    {"name": "和束町（京都府）", "lat": 34.7865, "lon": 135.9103, "sqm_level": 19.35},
-    {"name": "枚方市（大阪府）- ひらかたパーク", "lat": 34.8105, "lon": 135.6429, "sqm_level": 17.41},
-    {"name": "神戸市西区（兵庫県）- 西神南", "lat": 34.7088, "lon": 135.0396, "sqm_level": 19.36},
-    {"name": "淡路市（兵庫県）- 久留麻", "lat": 34.4833, "lon": 134.9667, "sqm_level": 19.03},
-    {"name": "香美町（兵庫県）", "lat": 35.6027, "lon": 134.6158, "sqm_level": 18.34},
-    {"name": "紀美野町（和歌山県）- みさと天文台", "lat": 34.1200, "lon": 135.3444, "sqm_level": 20.59},
-    {"name": "古座川町（和歌山県）", "lat": 33.5658, "lon": 135.6661, "sqm_level": 21.26},
-    
-    # 中国
-    {"name": "鳥取市（鳥取県）- さじアストロパーク", "lat": 35.3524, "lon": 134.0538, "sqm_level": 21.29},
-    {"name": "米子市（鳥取県）", "lat": 35.4283, "lon": 133.3314, "sqm_level": 20.33},
-    {"name": "倉吉市（鳥取県）- 関金町", "lat": 35.3789, "lon": 133.7225, "sqm_level": 20.88},
-    {"name": "境港市（鳥取県）", "lat": 35.5436, "lon": 133.2325, "sqm_level": 19.74},
-    {"name": "若桜町（鳥取県）", "lat": 35.3400, "lon": 134.3986, "sqm_level": 20.31},
-    {"name": "八頭町（鳥取県）", "lat": 35.3583, "lon": 134.2583, "sqm_level": 20.37},
-    {"name": "大山町（鳥取県）", "lat": 35.4678, "lon": 133.5222, "sqm_level": 20.67},
-    {"name": "伯耆町（鳥取県）", "lat": 35.3592, "lon": 133.4542, "sqm_level": 20.85},
-    {"name": "日南町（鳥取県）- 上萩山", "lat": 35.1098, "lon": 133.2081, "sqm_level": 21.04},
-    {"name": "日野町（鳥取県）", "lat": 35.2158, "lon": 133.3267, "sqm_level": 20.75},
-    {"name": "江府町（鳥取県）", "lat": 35.2817, "lon": 133.4756, "sqm_level": 20.63},
-    {"name": "松江市（島根県）- 八千代公園", "lat": 35.4950, "lon": 133.1556, "sqm_level": 20.50},
-    {"name": "浜田市（島根県）- 海の見える公園", "lat": 34.8981, "lon": 132.0678, "sqm_level": 20.65},
-    {"name": "出雲市（島根県）", "lat": 35.3650, "lon": 132.7564, "sqm_level": 20.98},
-    {"name": "大田市（島根県）", "lat": 35.1931, "lon": 132.4967, "sqm_level": 21.28},
-    {"name": "邑南町（島根県）", "lat": 34.8814, "lon": 132.6685, "sqm_level": 21.16},
-    {"name": "吉備中央町（岡山県）- 賀陽憩いの森公園", "lat": 34.8464, "lon": 133.7258, "sqm_level": 19.98},
-    {"name": "倉敷市（岡山県）- ライフパーク倉敷", "lat": 34.5678, "lon": 133.7820, "sqm_level": 20.74},
-    {"name": "井原市（岡山県）- 美星天文台", "lat": 34.6934, "lon": 133.5518, "sqm_level": 17.07},
-    {"name": "東広島市（広島県）- 憩いの森公園", "lat": 34.4092, "lon": 132.7447, "sqm_level": 18.83},
-    {"name": "山口市（山口県）- 阿東嘉年", "lat": 34.4601, "lon": 131.5287, "sqm_level": 21.33},
-    {"name": "周南市（山口県）", "lat": 34.0536, "lon": 131.8058, "sqm_level": 20.50},
-    
-    # 四国
-    {"name": "徳島市（徳島県）", "lat": 34.0700, "lon": 134.5547, "sqm_level": 19.55},
-    {"name": "石井町（徳島県）", "lat": 34.0722, "lon": 134.4658, "sqm_level": 19.32},
-    {"name": "松山市（愛媛県）", "lat": 33.8392, "lon": 132.7656, "sqm_level": 17.94},
-    {"name": "今治市（愛媛県）- 宮窪町", "lat": 34.1624, "lon": 133.0906, "sqm_level": 20.87},
-    {"name": "新居浜市（愛媛県）- 愛媛県総合科学博物館", "lat": 33.9189, "lon": 133.2503, "sqm_level": 19.70},
-    {"name": "西条市（愛媛県）", "lat": 33.9189, "lon": 133.1811, "sqm_level": 20.23},
-    {"name": "四国中央市（愛媛県）", "lat": 33.9833, "lon": 133.5500, "sqm_level": 20.36},
-    {"name": "久万高原町（愛媛県）- 天体観測館", "lat": 33.6823, "lon": 132.8953, "sqm_level": 21.08},
-    {"name": "高知市（高知県）- 土佐塾中学・高等学校", "lat": 33.5583, "lon": 133.4922, "sqm_level": 20.18},
-    {"name": "安芸市（高知県）", "lat": 33.5019, "lon": 133.9017, "sqm_level": 20.93},
-    {"name": "四万十市（高知県）- 四万十天文台", "lat": 33.0017, "lon": 132.9338, "sqm_level": 21.14},
-    {"name": "芸西村（高知県）- 芸西天文台", "lat": 33.5414, "lon": 133.8239, "sqm_level": 21.15},
-    {"name": "津野町（高知県）", "lat": 33.4862, "lon": 133.0903, "sqm_level": 21.36},
-    
-    # 九州・沖縄
-    {"name": "八女市（福岡県）- 星のふるさと公園", "lat": 33.2100, "lon": 130.7300, "sqm_level": 20.62},
-    {"name": "佐世保市（長崎県）- 白岳自然公園", "lat": 33.2803, "lon": 129.6178, "sqm_level": 20.58},
-    {"name": "熊本市北区（熊本県）", "lat": 32.8469, "lon": 130.7411, "sqm_level": 18.88},
-    {"name": "天草市（熊本県）", "lat": 32.4497, "lon": 130.1917, "sqm_level": 21.05},
-    {"name": "山都町（熊本県）", "lat": 32.7067, "lon": 131.0253, "sqm_level": 20.85},
-    {"name": "都城市（宮崎県）- 高崎町", "lat": 31.9167, "lon": 130.9833, "sqm_level": 19.85},
-    {"name": "奄美市（鹿児島県）", "lat": 28.3752, "lon": 129.4942, "sqm_level": 21.61},
-    {"name": "宇検村（鹿児島県）", "lat": 28.3031, "lon": 129.3242, "sqm_level": 21.44},
-    {"name": "瀬戸内町（鹿児島県）- 油井岳", "lat": 28.1705, "lon": 129.3243, "sqm_level": 21.66},
-    {"name": "龍郷町（鹿児島県）- 赤尾木", "lat": 28.4350, "lon": 129.5800, "sqm_level": 21.60},
-    {"name": "与論町（鹿児島県）", "lat": 27.0425, "lon": 128.4219, "sqm_level": 21.53},
-    {"name": "石垣市（沖縄県）", "lat": 24.3444, "lon": 124.1572, "sqm_level": 20.97},
-    {"name": "宮古島市（沖縄県）", "lat": 24.7915, "lon": 125.2844, "sqm_level": 21.41},
-    {"name": "名護市（沖縄県）", "lat": 26.5917, "lon": 127.9678, "sqm_level": 20.76},
-    {"name": "大宜味村（沖縄県）", "lat": 26.6978, "lon": 128.1364, "sqm_level": 21.23},
-    {"name": "東村（沖縄県）", "lat": 26.6333, "lon": 128.1500, "sqm_level": 21.18},
-    {"name": "今帰仁村（沖縄県）- 今帰仁城跡", "lat": 26.6917, "lon": 127.9272, "sqm_level": 21.07},
-    {"name": "本部町（沖縄県）", "lat": 26.6339, "lon": 127.8794, "sqm_level": 20.60},
-    {"name": "竹富町（沖縄県）- 波照間島", "lat": 24.0558, "lon": 123.7788, "sqm_level": 21.40},
-]
+from ephemeris import tonight_events
+from forecast_cache import ForecastCache
+from metrics import METRICS
+from prefetch import DAILY_CALL_BUDGET, PrefetchScheduler
+from scoring import DEFAULT_HORIZON_HOURS, rank_windows
+from search_core import cache_only_fetcher, cached_fetcher
+from spot_catalog import SpotCatalog
+from spot_search import DEFAULT_TOP_N, SEARCH_RADIUS_KM, estimate_travel_hours, find_nearby_spots, iter_search
+from weather_client import CALLS_PER_MINUTE, DAILY_CALL_LIMIT, OpenWeatherClient, SharedDailyQuota, create_session
 
 # --- 関数エリア ---
-@st.cache_data(ttl=600)
-def get_astro_data(latitude, longitude, api_key):
-    url = f"https://api.openweathermap.org/data/3.0/onecall?lat={latitude}&lon={longitude}&exclude=minutely,alerts&appid={api_key}&lang=ja&units=metric"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException:
-        return None
+# セッション内の検索結果は、現在地をこの桁数（約1km）に丸めて区別する
+LOCATION_DIGITS = 2
+# セッションごとに覚えておく検索結果の数
+MAX_SESSION_RESULTS = 20
+# 管理者パネルの cProfile で表示する関数の数
+PROFILE_TOP_FUNCTIONS = 25
+
+def location_key(latitude, longitude):
+    return (round(latitude, LOCATION_DIGITS), round(longitude, LOCATION_DIGITS))
+
+@st.cache_resource
+def get_http_session():
+    # サーバー全体で1つのコネクションプールを使い回す
+    return create_session()
+
+@st.cache_resource
+def get_weather_client(api_key):
+    # 全セッションで共有し、同じ地点への同時リクエストのまとめと呼び出し回数の制限を行う。
+    # 1日の呼び出し回数は予報キャッシュの SQLite に数え、再起動しても、同じファイルを使う他のプロセスとも共有する
+    daily_limit = int(st.secrets.get("OPENWEATHER_DAILY_LIMIT", DAILY_CALL_LIMIT))
+    return OpenWeatherClient(
+        api_key, session=get_http_session(),
+        calls_per_minute=int(st.secrets.get("OPENWEATHER_CALLS_PER_MINUTE", CALLS_PER_MINUTE)),
+        quota=SharedDailyQuota(get_forecast_cache().backend, daily_limit),
+    )
+
+@st.cache_resource
+def get_timezone_finder():
+    # TimezoneFinder はデータの読み込みに時間がかかるので、サーバー全体で1つを使い回す
+    return TimezoneFinder()
+
+@st.cache_resource
+def get_spot_catalog():
+    # 観測地カタログ（data/spots_v*.csv）はサーバー起動時に一度だけ読み込む
+    return SpotCatalog.load()
+
+@st.cache_resource
+def get_forecast_cache():
+    # 予報はディスク（SQLite）に保存し、再起動後や他のプロセスとも共有する
+    return ForecastCache()
+
+@st.cache_resource
+def get_prefetch_scheduler(api_key, daily_budget):
+    # サーバーごとに1つだけ起動し、全スポットの予報を裏で取り直し続ける
+    client = get_weather_client(api_key)
+    # 呼び出し回数は検索と同じ SharedDailyQuota から引き、検索の分を残しておく
+    scheduler = PrefetchScheduler(
+        get_spot_catalog(), get_forecast_cache(), client.fetch,
+        daily_budget=daily_budget, quota=client.quota,
+    )
+    if daily_budget > 0:
+        scheduler.start()
+    return scheduler
+
+def get_forecast(latitude, longitude, api_key):
+    return cached_fetcher(get_forecast_cache(), get_weather_client(api_key))(latitude, longitude)
 
 def estimate_travel_time(distance_km):
-    avg_speed_kmh = 40
-    time_h = distance_km / avg_speed_kmh
+    time_h = estimate_travel_hours(distance_km)
     total_minutes = int(time_h * 60)
     if total_minutes < 60:
         return f"{total_minutes}分"
@@ -199,14 +88,6 @@ def estimate_travel_time(distance_km):
         minutes = total_minutes % 60
         return f"{hours}時間{minutes}分"
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371
-    dLat = math.radians(lat2 - lat1)
-    dLon = math.radians(lon2 - lon1)
-    a = math.sin(dLat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
 def get_sqm_description(sqm_value):
     if sqm_value >= 21.75: return "光害が全くない最高の夜空。天の川が雲のように明るく見えるレベルです。"
     elif sqm_value >= 21.5: return "非常に暗い夜空。天の川の構造がはっきりと見えます。"
@@ -222,6 +103,96 @@ def get_weather_emoji(cloudiness):
     elif cloudiness <= 80: return "☁️"
     else: return "🌧️"
 
+def render_spot_card(rank, spot, tf, selected_timezone):
+    st.subheader(f"🏆 おすすめ No.{rank}： {spot['name']}")
+    st.write(f" - **あなたからの距離:** 約`{spot['distance']:.1f}` km")
+    travel_time_str = estimate_travel_time(spot['distance'])
+    travel_type = "🚗 車での移動時間"
+    st.write(f" - **{travel_type}:** 約`{travel_time_str}`")
+    st.markdown("---")
+
+    st.write(f"**空の暗さ（SQM値）:** `{spot['base_sqm']}` SQM")
+    st.caption(get_sqm_description(spot['base_sqm']))
+    st.write(f"**現在の雲量:** `{spot['cloudiness']}` %")
+    forecast = spot["forecast"]
+    if time.time() - forecast.observed_at > 3600:
+        st.caption(f"⚠️ この雲量は約{int((time.time() - forecast.observed_at) // 3600)}時間前の予報です。")
+
+    spot_tz_str = tf.timezone_at(lng=spot["lon"], lat=spot["lat"])
+    spot_tz = pytz.timezone(spot_tz_str if spot_tz_str else 'Asia/Tokyo')
+
+    sky = tonight_events(get_spot_catalog(), time.time())
+    moonrise_ts = sky["moonrise"][spot["index"]]
+    moonset_ts = sky["moonset"][spot["index"]]
+
+    def format_time(timestamp, timezone):
+        return datetime.fromtimestamp(timestamp, tz=timezone).strftime('%H:%M') if not math.isnan(timestamp) else "なし"
+
+    moonrise_time = format_time(moonrise_ts, spot_tz)
+    moonset_time = format_time(moonset_ts, spot_tz)
+    dusk_time = format_time(sky["dusk"][spot["index"]], spot_tz)
+    dawn_time = format_time(sky["dawn"][spot["index"]], spot_tz)
+
+    st.write(f"**今夜の月の動き:** 🌕 **月の出:** `{moonrise_time}` / **月の入り:** `{moonset_time}`（輝面比 `{sky['illumination'][spot['index']]:.0%}`）")
+    st.write(f"**星空が暗くなる時間（天文薄明）:** 🌌 `{dusk_time}` 〜 `{dawn_time}`")
+    st.caption("この時刻を参考に、月明かりを避ける計画を立てましょう。")
+
+    if len(forecast.hourly_clouds):
+        st.write("**これからの天気（1時間ごと）**")
+        cols = st.columns(5)
+        hourly_times = forecast.hourly_times()
+        user_tz = pytz.timezone(selected_timezone)
+
+        for j in range(min(5, len(hourly_times) - 1)):
+            hour_clouds = int(forecast.hourly_clouds[j+1])
+            utc_dt = datetime.fromtimestamp(int(hourly_times[j+1]), tz=pytz.utc)
+            local_dt = utc_dt.astimezone(user_tz)
+            time_str = local_dt.strftime('%H時')
+            with cols[j]:
+                st.markdown(f"<div style='text-align: center;'>{time_str}</div>", unsafe_allow_html=True)
+                emoji = get_weather_emoji(hour_clouds)
+                st.markdown(f"<div style='text-align: center; font-size: 2.5em; line-height: 1;'>{emoji}</div>", unsafe_allow_html=True)
+                st.markdown(f"<div style='text-align: center;'>{hour_clouds}%</div>", unsafe_allow_html=True)
+
+    maps_url = f"https://www.google.com/maps/search/?api=1&query={spot['lat']},{spot['lon']}"
+    st.markdown(f"**[🗺️ Googleマップで場所を確認する]({maps_url})**")
+
+    tag_name = spot['name'].split('（')[0].split('-')[0].strip()
+    instagram_url = f"https://www.instagram.com/explore/tags/{urllib.parse.quote(tag_name)}/"
+    st.markdown(f"**[📸 Instagramで「#{tag_name}」の写真を見る]({instagram_url})**")
+
+    st.markdown("---")
+    st.caption("この場所をシェアする")
+    share_text = f"おすすめの星空スポット【{spot['name']}】を見つけました！\n現在の雲量は{spot['cloudiness']}%、空の暗さは{spot['base_sqm']}SQMです。\nあなたも最高の星空を探しに行こう！\n#ホシドコ #星空観測 #天体観測\n"
+    app_url = "https://hosidoko.streamlit.app/" # TODO: "https://hosidoko.streamlit.app/"
+
+    encoded_text = urllib.parse.quote(share_text)
+    encoded_app_url = urllib.parse.quote(app_url)
+
+    button_style = "display: inline-block; text-decoration: none; color: white; padding: 6px 10px; border-radius: 8px; text-align: center; font-size: 14px;"
+
+    share_col1, share_col2, share_col3, _ = st.columns([1,1,1,1])
+    with share_col1:
+        st.markdown(f'<a href="https://twitter.com/intent/tweet?text={encoded_text}&url={encoded_app_url}" target="_blank" style="{button_style} background-color: #1DA1F2;">Xでシェア</a>', unsafe_allow_html=True)
+    with share_col2:
+        st.markdown(f'<a href="https://www.facebook.com/sharer/sharer.php?u={encoded_app_url}" target="_blank" style="{button_style} background-color: #1877F2;">Facebook</a>', unsafe_allow_html=True)
+    with share_col3:
+        st.markdown(f'<a href="https://line.me/R/msg/text/?{encoded_text}{encoded_app_url}" target="_blank" style="{button_style} background-color: #06C755;">LINE</a>', unsafe_allow_html=True)
+
+    st.divider()
+
+def refresh_spot_forecast(spot):
+    forecast = get_forecast(spot["lat"], spot["lon"], API_KEY)
+    if forecast is not None:
+        spot["forecast"] = forecast
+        spot["cloudiness"] = forecast.current_clouds
+
+@st.fragment
+def spot_card_fragment(rank, spot, tf, selected_timezone):
+    # カードごとに独立して再実行されるので、更新ボタンを押してもページ全体は再実行されない
+    render_spot_card(rank, spot, tf, selected_timezone)
+    st.button("🔄 この場所の天気を更新", key=f"refresh_{spot['index']}", on_click=refresh_spot_forecast, args=(spot,))
+
 # --- アプリ本体 ---
 st.set_page_config(page_title="ホシドコ - 雲量、暗さを指定後、天体観測地をご案内！", page_icon="🌠")
 st.title("🌠 ホシドコ 🔭")
@@ -233,6 +204,14 @@ except (FileNotFoundError, KeyError):
     st.error("【開発者向けエラー】secrets.tomlファイルまたはAPIキーの設定が見つかりません。")
     st.stop()
 
+# 計測は secrets の METRICS_ENABLED で有効にし、URL の ?admin=<ADMIN_TOKEN> で管理者パネルを表示する
+if st.secrets.get("METRICS_ENABLED", False):
+    METRICS.enabled = True
+ADMIN_TOKEN = st.secrets.get("ADMIN_TOKEN")
+is_admin = bool(ADMIN_TOKEN) and st.query_params.get("admin") == ADMIN_TOKEN
+
+prefetch_scheduler = get_prefetch_scheduler(API_KEY, int(st.secrets.get("PREFETCH_DAILY_BUDGET", DAILY_CALL_BUDGET)))
+
 # --- サイドバー ---
 st.sidebar.header("運営者情報")
 st.sidebar.markdown("[📝 使い方や開発背景はこちら(note)](https://note.com/mute_murre9731/n/n163fc351ed30)")
@@ -240,6 +219,34 @@ st.sidebar.markdown("---")
 st.sidebar.markdown("ご意見・ご感想はこちらまで")
 st.sidebar.markdown("`oshika0829zan@gmail.com`")
 
+with st.sidebar.expander("🛰️ 天気予報の先読み状況"):
+    prefetch_status = prefetch_scheduler.status()
+    if prefetch_status["last_refresh_at"]:
+        last_refresh = datetime.fromtimestamp(prefetch_status["last_refresh_at"], tz=pytz.timezone('Asia/Tokyo')).strftime('%m/%d %H:%M:%S')
+    else:
+        last_refresh = "未実行"
+    st.write(f"**最終更新:** `{last_refresh}`（{prefetch_status['last_refreshed']}件）")
+    client_stats = get_weather_client(API_KEY).stats()
+    st.write(
+        f"**本日のAPI使用回数（合計）:** `{client_stats['daily_limit'] - client_stats['quota_remaining']}` / "
+        f"`{client_stats['daily_limit']}` 回"
+    )
+    st.write(f"**うち先読み:** `{prefetch_status['calls_today']}` / `{prefetch_status['daily_budget']}` 回")
+    st.write(f"**最新の予報があるスポット:** `{prefetch_status['warm_spots']}` / `{prefetch_status['total_spots']}` 件")
+    cache_stats = get_forecast_cache().stats()
+    st.caption(
+        f"キャッシュ: ヒット {cache_stats['hits']} / 古い予報で応答 {cache_stats['stale_hits']} / ミス {cache_stats['misses']}"
+        f"（ヒット率 {cache_stats['hit_rate']:.0%}）"
+    )
+    st.caption(
+        f"API: 呼び出し {client_stats['calls']}（うち再試行 {client_stats['retries']}）/ まとめた重複 {client_stats['coalesced']} / "
+        f"待ちきれず中止 {client_stats['throttled']} / 上限で中止 {client_stats['quota_rejected']} / 失敗 {client_stats['failures']}"
+        f"（本日の残り {client_stats['quota_remaining']} / {client_stats['daily_limit']} 回）"
+    )
+
+# 管理者パネルは検索の計測が終わってから、ページの最後で中身を描く
+admin_panel = st.sidebar.container() if is_admin else None
+
 # --- メイン画面 ---
 st.header("① あなたの希望の条件は？")
 desired_sqm = st.slider("目標の空の暗さ（SQM値）", 15.0, 22.0, 19.0, 0.1, help="SQMは空の明るさを示す単位で、数値が高いほど暗く、星空観測に適しています。")
@@ -254,6 +261,13 @@ desired_cloud_cover = st.select_slider(
 )
 st.info(f"雲が{desired_cloud_cover}%以下の場所を探します。")
 
+top_n = st.slider("表示する候補地の数", 1, 10, DEFAULT_TOP_N, 1)
+search_all = st.checkbox(
+    "すべての候補地の天気を調べる",
+    value=False,
+    help="オフのときは近い順に調べ、条件に合う場所が表示件数分見つかった時点で検索を終えます（高速）。オンにすると見つかった総数も表示します。"
+)
+
 st.header("② おすすめの場所を探す")
 col1, col2 = st.columns([1, 4])
 with col1:
@@ -262,6 +276,7 @@ with col2:
     st.markdown("##### 📍 位置情報の許可を！")
     st.caption("左のマークを押して、このサイトの位置情報利用を許可してください。")
 
+search_clicked = False
 if location_data:
     current_lat, current_lon = location_data.get('latitude'), location_data.get('longitude')
 
@@ -269,129 +284,214 @@ if location_data:
         if current_lat is None or current_lon is None:
             st.error("有効な位置情報が取得できませんでした。")
         else:
-            search_radius_km = 500
-            
-            nearby_spots = []
-            for spot in SPOTS:
-                distance = calculate_distance(current_lat, current_lon, spot["lat"], spot["lon"])
-                if distance <= search_radius_km:
-                    spot['distance'] = distance
-                    nearby_spots.append(spot)
-            
-            if not nearby_spots:
-                st.warning(f"半径{search_radius_km}km以内に、登録されている観測スポットがありませんでした。")
-            else:
-                st.info(f"あなたの現在地から半径{search_radius_km}km以内にある{len(nearby_spots)}件の候補地を調査します...")
-                with st.spinner("候補地の天気情報を収集中..."):
-                    viable_spots = []
-                    tf = TimezoneFinder()
-                    for spot in nearby_spots:
-                        if spot.get("sqm_level", 0) < desired_sqm:
-                            continue
-
-                        astro_data = get_astro_data(spot["lat"], spot["lon"], API_KEY)
-                        if astro_data:
-                            cloudiness = astro_data["current"]["clouds"]
-                            if cloudiness > desired_cloud_cover:
-                                continue
-                            
-                            viable_spots.append({
-                                "name": spot["name"], "lat": spot["lat"], "lon": spot["lon"],
-                                "distance": spot["distance"], "base_sqm": spot["sqm_level"],
-                                "cloudiness": cloudiness,
-                                "astro_data": astro_data 
-                            })
-                        time.sleep(0.1)
-                
-                st.header("③ 検索結果")
-                if not viable_spots:
-                    st.warning("残念ながら、現在の条件に合うスポットは見つかりませんでした。条件を緩めて再検索してみてください。")
-                else:
-                    top_spots = sorted(viable_spots, key=lambda x: x["distance"])[:3]
-                    st.success(f"発見！あなたの条件に合う場所が {len(viable_spots)}件 見つかりました。近い順に最大3件表示します。")
-                    
-                    selected_timezone = tf.timezone_at(lng=current_lon, lat=current_lat)
-                    if not selected_timezone:
-                        selected_timezone = 'Asia/Tokyo'
-                    
-                    for i, spot in enumerate(top_spots):
-                        st.subheader(f"🏆 おすすめ No.{i+1}： {spot['name']}")
-                        st.write(f" - **あなたからの距離:** 約`{spot['distance']:.1f}` km")
-                        travel_time_str = estimate_travel_time(spot['distance'])
-                        travel_type = "🚗 車での移動時間"
-                        st.write(f" - **{travel_type}:** 約`{travel_time_str}`")
-                        st.markdown("---")
-                        
-                        st.write(f"**空の暗さ（SQM値）:** `{spot['base_sqm']}` SQM")
-                        st.caption(get_sqm_description(spot['base_sqm']))
-                        st.write(f"**現在の雲量:** `{spot['cloudiness']}` %")
-
-                        if spot.get("astro_data"):
-                            spot_tz_str = tf.timezone_at(lng=spot["lon"], lat=spot["lat"])
-                            spot_tz = pytz.timezone(spot_tz_str if spot_tz_str else 'Asia/Tokyo')
-                            
-                            today_moon_data = spot["astro_data"]["daily"][0]
-                            moonrise_ts = today_moon_data.get("moonrise")
-                            moonset_ts = today_moon_data.get("moonset")
-
-                            def format_time(timestamp, timezone):
-                                return datetime.fromtimestamp(timestamp, tz=timezone).strftime('%H:%M') if timestamp else "N/A"
-
-                            moonrise_time = format_time(moonrise_ts, spot_tz)
-                            moonset_time = format_time(moonset_ts, spot_tz)
-                            
-                            st.write(f"**今日の月の動き:** 🌕 **月の出:** `{moonrise_time}` / **月の入り:** `{moonset_time}`")
-                            st.caption("この時刻を参考に、月明かりを避ける計画を立てましょう。")
-
-                        if spot.get("astro_data") and spot["astro_data"].get("hourly"):
-                            st.write("**これからの天気（1時間ごと）**")
-                            cols = st.columns(5)
-                            hourly_data = spot["astro_data"]["hourly"]
-                            user_tz = pytz.timezone(selected_timezone)
-
-                            for j in range(min(5, len(hourly_data) - 1)):
-                                hour_data = hourly_data[j+1]
-                                utc_dt = datetime.fromtimestamp(hour_data["dt"], tz=pytz.utc)
-                                local_dt = utc_dt.astimezone(user_tz)
-                                time_str = local_dt.strftime('%H時')
-                                with cols[j]:
-                                    st.markdown(f"<div style='text-align: center;'>{time_str}</div>", unsafe_allow_html=True)
-                                    emoji = get_weather_emoji(hour_data["clouds"])
-                                    st.markdown(f"<div style='text-align: center; font-size: 2.5em; line-height: 1;'>{emoji}</div>", unsafe_allow_html=True)
-                                    st.markdown(f"<div style='text-align: center;'>{hour_data['clouds']}%</div>", unsafe_allow_html=True)
-
-                        maps_url = f"https://www.google.com/maps/search/?api=1&query={spot['lat']},{spot['lon']}"
-                        st.markdown(f"**[🗺️ Googleマップで場所を確認する]({maps_url})**")
-
-                        tag_name = spot['name'].split('（')[0].split('-')[0].strip()
-                        instagram_url = f"https://www.instagram.com/explore/tags/{urllib.parse.quote(tag_name)}/"
-                        st.markdown(f"**[📸 Instagramで「#{tag_name}」の写真を見る]({instagram_url})**")
-
-                        st.markdown("---")
-                        st.caption("この場所をシェアする")
-                        share_text = f"おすすめの星空スポット【{spot['name']}】を見つけました！\n現在の雲量は{spot['cloudiness']}%、空の暗さは{spot['base_sqm']}SQMです。\nあなたも最高の星空を探しに行こう！\n#ホシドコ #星空観測 #天体観測\n"
-                        app_url = "https://hosidoko.streamlit.app/" # TODO: "https://hosidoko.streamlit.app/"
-                        
-                        encoded_text = urllib.parse.quote(share_text)
-                        encoded_app_url = urllib.parse.quote(app_url)
-                        
-                        button_style = "display: inline-block; text-decoration: none; color: white; padding: 6px 10px; border-radius: 8px; text-align: center; font-size: 14px;"
-
-                        share_col1, share_col2, share_col3, _ = st.columns([1,1,1,1])
-                        with share_col1:
-                            st.markdown(f'<a href="https://twitter.com/intent/tweet?text={encoded_text}&url={encoded_app_url}" target="_blank" style="{button_style} background-color: #1DA1F2;">Xでシェア</a>', unsafe_allow_html=True)
-                        with share_col2:
-                            st.markdown(f'<a href="https://www.facebook.com/sharer/sharer.php?u={encoded_app_url}" target="_blank" style="{button_style} background-color: #1877F2;">Facebook</a>', unsafe_allow_html=True)
-                        with share_col3:
-                            st.markdown(f'<a href="https://line.me/R/msg/text/?{encoded_text}{encoded_app_url}" target="_blank" style="{button_style} background-color: #06C755;">LINE</a>', unsafe_allow_html=True)
-                        
-                        st.divider()
+            search_clicked = True
+            st.session_state["search_origin"] = (current_lat, current_lon)
 else:
     st.info("ページ上部のマークを押して、位置情報の使用を許可してください。")
 
+# 一度検索した後は、スライダーを動かしたり位置情報が再取得されたりして再実行されても、
+# このセッションで取得済みの予報から結果を作り直す（APIは呼ばない）
+search_origin = st.session_state.get("search_origin")
+if search_origin is not None:
+    # 検索1回の区間ごとの時間（METRICS が有効なときだけ記録される）
+    trace = {}
+    request_started_at = time.perf_counter()
+    profiler = None
+    if is_admin and st.query_params.get("profile") == "1":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 別のセッションが計測中（Python 3.12 以降は同時に1つまで）
+            profiler = None
+
+    origin_lat, origin_lon = search_origin
+    search_radius_km = SEARCH_RADIUS_KM
+    if search_clicked:
+        prefetch_scheduler.record_search(origin_lat, origin_lon)
+    with METRICS.span("distance_scan", trace):
+        nearby_spots = find_nearby_spots(get_spot_catalog(), origin_lat, origin_lon, search_radius_km)
+
+    if not nearby_spots:
+        st.warning(f"半径{search_radius_km}km以内に、登録されている観測スポットがありませんでした。")
+    else:
+        st.info(f"あなたの現在地から半径{search_radius_km}km以内にある{len(nearby_spots)}件の候補地を調査します...")
+        with METRICS.span("timezone", trace):
+            tf = get_timezone_finder()
+            selected_timezone = tf.timezone_at(lng=origin_lon, lat=origin_lat)
+        if not selected_timezone:
+            selected_timezone = 'Asia/Tokyo'
+
+        origin_key = location_key(origin_lat, origin_lon)
+        search_key = (origin_key, desired_sqm, desired_cloud_cover, top_n, search_all)
+        session_forecasts = st.session_state.setdefault("session_forecasts", {}).setdefault(origin_key, {})
+        session_results = st.session_state.setdefault("search_results", {})
+
+        notice_area = st.container()
+        st.header("③ 検索結果")
+        result_status = st.empty()
+        card_slots = [st.empty() for _ in range(top_n)]
+
+        if not search_clicked and search_key in session_results:
+            search_result = session_results[search_key]
+        else:
+            def fetch_for_search(spot):
+                # ボタンを押したときは最新の予報を取りに行き、それ以外はセッション内と保存済みの予報だけを使う
+                forecast = None if search_clicked else session_forecasts.get(spot["index"])
+                if forecast is None:
+                    with METRICS.span("spot_fetch"):
+                        if search_clicked:
+                            forecast = get_forecast(spot["lat"], spot["lon"], API_KEY)
+                        else:
+                            forecast = cache_only_fetcher(get_forecast_cache())(spot["lat"], spot["lon"])
+                if forecast is not None:
+                    session_forecasts[spot["index"]] = forecast
+                return forecast
+
+            progress_bar = st.progress(0.0, text="候補地の天気情報を収集中...")
+            # 天気が届いた順に、条件に合う場所を近い順の枠へ表示していく
+            started_at = time.perf_counter()
+            first_result_seconds = None
+            found_spots = []
+            shown_spots = []
+            for event in iter_search(
+                nearby_spots,
+                fetch_for_search,
+                desired_sqm,
+                desired_cloud_cover,
+                top_n=top_n,
+                lazy=not search_all,
+            ):
+                if event["kind"] == "done":
+                    search_result = event
+                    break
+                progress_bar.progress(
+                    event["resolved"] / event["total"],
+                    text=f"候補地の天気情報を収集中... {event['resolved']} / {event['total']} 件",
+                )
+                if event["status"] != "viable":
+                    continue
+                if first_result_seconds is None:
+                    first_result_seconds = time.perf_counter() - started_at
+                found_spots.append(event["spot"])
+                found_spots.sort(key=lambda x: x["distance"])
+                # より近い場所が見つかったら、順位が変わった枠だけ描き直す
+                with METRICS.span("render", trace):
+                    for rank, spot in enumerate(found_spots[:top_n]):
+                        if rank >= len(shown_spots) or shown_spots[rank] is not spot:
+                            with card_slots[rank].container():
+                                render_spot_card(rank + 1, spot, tf, selected_timezone)
+                shown_spots = found_spots[:top_n]
+            search_seconds = time.perf_counter() - started_at
+            # 天気の取得を待っていた時間（途中で描いた時間を除く）と、最初の候補を表示するまでの時間
+            METRICS.observe("weather_search", search_seconds - trace.get("render", 0.0), trace)
+            if first_result_seconds is not None:
+                METRICS.observe("first_result", first_result_seconds, trace)
+            progress_bar.empty()
+
+            session_results[search_key] = search_result
+            while len(session_results) > MAX_SESSION_RESULTS:
+                session_results.pop(next(iter(session_results)))
+            # 検索結果が残っていない出発地の予報も一緒に忘れる
+            kept_origins = {key[0] for key in session_results}
+            forecasts_by_origin = st.session_state["session_forecasts"]
+            for key in [key for key in forecasts_by_origin if key not in kept_origins]:
+                del forecasts_by_origin[key]
+
+        viable_spots = search_result["viable_spots"]
+        unknown_spots = search_result["unknown_spots"]
+
+        # 検索が終わったら、各スポットの枠を更新ボタン付きのフラグメントで描き直す
+        with METRICS.span("render", trace):
+            for rank, spot in enumerate(viable_spots[:top_n]):
+                with card_slots[rank].container():
+                    spot_card_fragment(rank + 1, spot, tf, selected_timezone)
+
+        with notice_area:
+            if unknown_spots:
+                with st.expander(f"⚠️ {len(unknown_spots)}件の候補地は天気情報を取得できませんでした（天気不明）"):
+                    for spot in unknown_spots:
+                        st.write(f" - {spot['name']}（約`{spot['distance']:.1f}` km）")
+                    if not search_clicked:
+                        st.caption("条件を変えた場合は保存済みの予報だけで探しています。最新の天気で調べるには、もう一度検索ボタンを押してください。")
+            if get_weather_client(API_KEY).quota_exhausted:
+                st.warning("本日の天気API呼び出し回数の上限に達したため、保存済みの予報で検索しています。実際の天気と異なる場合があります。")
+            if search_result["skipped"]:
+                st.caption(f"近い順に{search_result['fetched']}件を調べた時点で見つかったため、残り{search_result['skipped']}件の天気の確認を省略しました。")
+
+        if not viable_spots:
+            result_status.warning("残念ながら、現在の条件に合うスポットは見つかりませんでした。条件を緩めて再検索してみてください。")
+        elif search_all:
+            result_status.success(f"発見！あなたの条件に合う場所が {len(viable_spots)}件 見つかりました。近い順に最大{top_n}件表示します。")
+        else:
+            result_status.success(f"発見！あなたの条件に合う場所を近い順に {len(viable_spots[:top_n])}件 表示します。")
+
+        dark_spots = [spot for spot in nearby_spots if spot["sqm_level"] >= desired_sqm]
+        if search_clicked:
+            # 先読み済みの予報もセッションに取り込み、採点の対象を広げる（APIは呼ばない）
+            for spot in dark_spots:
+                if spot["index"] not in session_forecasts:
+                    entry = get_forecast_cache().peek(spot["lat"], spot["lon"])
+                    if entry:
+                        session_forecasts[spot["index"]] = entry[1]
+        with METRICS.span("ranking", trace):
+            plans = rank_windows(
+                dark_spots, [session_forecasts.get(spot["index"]) for spot in dark_spots], time.time(),
+                desired_cloud_cover=desired_cloud_cover, top_n=top_n, horizon_hours=DEFAULT_HORIZON_HOURS,
+            )
+        if plans:
+            st.header(f"④ これから{DEFAULT_HORIZON_HOURS}時間の「いつ・どこ」おすすめ")
+            st.caption("取得済みの1時間ごとの予報から、天文薄明が終わった暗い時間帯について、雲の少なさ・空の暗さ・移動時間・月明かりを合わせて採点しています。")
+            plan_tz = pytz.timezone(selected_timezone)
+            for i, plan in enumerate(plans):
+                arrival = datetime.fromtimestamp(plan["arrival_slot"], tz=plan_tz).strftime('%H時')
+                moon_text = f"月あり（輝面比{plan['moon_illumination']:.0%}）" if plan["moon_up"] else "月なし"
+                st.write(
+                    f"{i+1}. **{plan['name']}** — `{arrival}`台に観測 / 雲量 `{plan['clouds']}`% / "
+                    f"`{plan['sqm_level']}` SQM / {moon_text} / 🚗 約`{estimate_travel_time(plan['distance'])}`"
+                )
+
+    METRICS.observe("search_request", time.perf_counter() - request_started_at, trace)
+    METRICS.incr("searches")
+    METRICS.log_request(trace, clicked=search_clicked, origin=list(location_key(origin_lat, origin_lon)),
+                        candidates=len(nearby_spots))
+    st.session_state["last_trace"] = trace
+    if profiler is not None:
+        profiler.disable()
+        profile_text = io.StringIO()
+        pstats.Stats(profiler, stream=profile_text).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        st.session_state["last_profile"] = profile_text.getvalue()
+
 # --- 出典表示 ---
 st.divider()
 st.caption("""
 観測地点のスカイクオリティ(SQM)基準値は、環境省「全国星空継続観察」の過去のデータを参考にしています。
 参照元: https://www.env.go.jp/press/press_03979.html
 """)
+
+# --- 管理者パネル ---
+if admin_panel is not None:
+    with admin_panel.expander("🔧 運用メトリクス", expanded=True):
+        if not METRICS.enabled:
+            st.caption("計測は無効です。secrets の METRICS_ENABLED を true にすると記録を始めます。")
+        snapshot = METRICS.snapshot()
+        if snapshot["spans"]:
+            st.write("**区間ごとの処理時間（ms）**")
+            st.table([
+                {"区間": name, "回数": span["count"], "p50": round(span["p50"] * 1000, 1),
+                 "p95": round(span["p95"] * 1000, 1), "最大": round(span["max"] * 1000, 1)}
+                for name, span in sorted(snapshot["spans"].items())
+            ])
+        last_trace = st.session_state.get("last_trace")
+        if last_trace:
+            st.write("**直前の検索の内訳（ms）**")
+            st.json({name: round(seconds * 1000, 1) for name, seconds in last_trace.items()})
+        gauges = {
+            "forecast_cache": get_forecast_cache().stats(),
+            "openweather": get_weather_client(API_KEY).stats(),
+            "prefetch": prefetch_scheduler.status(),
+        }
+        st.download_button("Prometheus 形式で保存", METRICS.prometheus_text(gauges), file_name="hoshidoko_metrics.txt")
+        st.caption("URL に &profile=1 を付けると、検索1回分の cProfile（メインスレッドのみ）をここに表示します。")
+        if st.session_state.get("last_profile"):
+            st.code(st.session_state["last_profile"], language="text")
@@ -0,0 +1,164 @@
+"""多数の出発地について、まとめて「今夜のおすすめスポット」を検索する。
+
+出発地のファイルは lat, lon の列（任意で id）を持つ CSV か、同じキーを持つ JSONL。
+出発地はプロセスプールで並列に検索し、予報は全プロセスで同じ SQLite キャッシュ
+（forecast_cache.DEFAULT_CACHE_PATH）を共有する。あるスポットを取得中のプロセスは
+キャッシュに印（claim）を付け、他のプロセスはその予報が保存されるのを待つので、
+同じスポットを同時に問い合わせることはない（取得に失敗した場合は次のプロセスが
+取り直すので、その分は呼び出しが増える）。1日・1分あたりの呼び出し回数の上限も
+同じファイルで全プロセスが共有する。
+
+    OPENWEATHER_API_KEY=... python batch_search.py origins.csv -o results.jsonl
+    python batch_search.py origins.csv --cache-only --format csv -o results.csv
+
+結果は出発地の順番のまま書き出し、処理速度（出発地/秒）を標準エラーに表示する。
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from forecast_cache import DEFAULT_CACHE_PATH, ForecastCache, SQLiteBackend
+from scoring import DEFAULT_HORIZON_HOURS
+from search_core import cache_only_fetcher, cached_fetcher, search
+from spot_catalog import DEFAULT_CATALOG_PATH, SpotCatalog
+from spot_search import DEFAULT_TOP_N, SEARCH_RADIUS_KM
+from weather_client import (CALLS_PER_MINUTE, DAILY_CALL_LIMIT, MAX_WORKERS, OpenWeatherClient, SharedDailyQuota,
+                            SharedTokenBucket)
+
+CSV_FIELDS = [
+    "origin_id", "origin_lat", "origin_lon", "rank", "name", "lat", "lon",
+    "distance_km", "sqm_level", "cloudiness", "moonrise", "moonset", "dusk", "dawn",
+]
+
+# ワーカープロセスごとに1つずつ持つ（_init_worker で作る）
+_worker = {}
+
+
+def read_origins(path):
+    """出発地を {"id", "lat", "lon"} の辞書のリストとして読み込む。"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [
+        {"id": row.get("id", str(i)), "lat": float(row["lat"]), "lon": float(row["lon"])}
+        for i, row in enumerate(rows)
+    ]
+
+
+def _init_worker(catalog_path, cache_path, api_key, calls_per_minute, daily_limit, options):
+    catalog = SpotCatalog.load(catalog_path)
+    backend = SQLiteBackend(cache_path)
+    cache = ForecastCache(backend)
+    if api_key:
+        client = OpenWeatherClient(
+            api_key,
+            quota=SharedDailyQuota(backend, daily_limit),
+            bucket=SharedTokenBucket(backend, calls_per_minute / 60, calls_per_minute),
+        )
+        fetch = cached_fetcher(cache, client)
+    else:
+        fetch = cache_only_fetcher(cache)
+    _worker.update(catalog=catalog, fetch=fetch, options=options)
+
+
+def _search_origin(origin):
+    result = search(_worker["catalog"], _worker["fetch"], origin["lat"], origin["lon"], **_worker["options"])
+    return {"origin": origin, **result}
+
+
+def write_jsonl(results, out):
+    for result in results:
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        yield result
+
+
+def write_csv(results, out):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for result in results:
+        origin = result["origin"]
+        for rank, spot in enumerate(result["viable_spots"], start=1):
+            writer.writerow({
+                "origin_id": origin["id"], "origin_lat": origin["lat"], "origin_lon": origin["lon"],
+                "rank": rank, **spot,
+            })
+        yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多数の出発地について、条件に合う観測スポットを一括で検索する。")
+    parser.add_argument("origins", help="出発地の CSV（lat, lon 列）または JSONL")
+    parser.add_argument("-o", "--output", help="出力先（省略時は標準出力）")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="出力形式（省略時は出力先の拡張子から決める）")
+    parser.add_argument("--sqm", type=float, default=19.0, help="目標の空の暗さ（SQM値）")
+    parser.add_argument("--cloud", type=int, default=30, help="許容できる雲の上限（%%）")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N)
+    parser.add_argument("--radius", type=float, default=SEARCH_RADIUS_KM, help="検索半径（km）")
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON_HOURS, help="「いつ・どこ」を採点する時間数")
+    parser.add_argument("--search-all", action="store_true", help="すべての候補地の天気を調べる")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="プロセス数")
+    parser.add_argument("--threads", type=int,
+                        help=f"1つの出発地で同時に問い合わせるスポット数（既定: {MAX_WORKERS}、--cache-only のときは 1）")
+    parser.add_argument("--chunksize", type=int, default=16, help="1回にワーカーへ渡す出発地の数")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="予報キャッシュ（SQLite）のパス")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="観測地カタログの CSV")
+    parser.add_argument("--cache-only", action="store_true", help="API を呼ばず、保存済みの予報だけで検索する")
+    parser.add_argument("--calls-per-minute", type=int, default=CALLS_PER_MINUTE)
+    parser.add_argument("--daily-limit", type=int, default=DAILY_CALL_LIMIT)
+    args = parser.parse_args(argv)
+
+    api_key = None if args.cache_only else os.environ.get("OPENWEATHER_API_KEY")
+    if not args.cache_only and not api_key:
+        parser.error("OPENWEATHER_API_KEY を設定するか、--cache-only を指定してください")
+    output_format = args.format or ("csv" if args.output and args.output.endswith(".csv") else "jsonl")
+
+    origins = read_origins(args.origins)
+    # 出発地は chunksize 件ずつワーカーへ渡すので、塊がプロセス数より少ないと働かないプロセスが出る。
+    # 塊をプロセス数以上に分け、プロセスは実際の塊の数だけ立てる
+    chunksize = max(1, min(args.chunksize, math.ceil(len(origins) / max(1, args.workers))))
+    workers = max(1, min(args.workers, math.ceil(len(origins) / chunksize)))
+    # 保存済みの予報を読むだけならスレッドを立てる方が遅い
+    threads = args.threads or (1 if args.cache_only else MAX_WORKERS)
+    # 1日・1分あたりの上限はキャッシュのファイルで全プロセスが共有する
+    initargs = (
+        args.catalog, args.cache, api_key, args.calls_per_minute, args.daily_limit,
+        {
+            "desired_sqm": args.sqm, "desired_cloud_cover": args.cloud, "top_n": args.top_n,
+            "radius_km": args.radius, "lazy": not args.search_all, "horizon_hours": args.horizon,
+            "max_workers": threads,
+        },
+    )
+    # キャッシュのテーブルはワーカーが同時に作らないよう、先に作っておく。
+    # 開いたままの接続を fork したワーカーに引き継ぐと SQLite が壊れるので閉じておく
+    SQLiteBackend(args.cache).close()
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    started_at = time.perf_counter()
+    searched = with_results = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            results = executor.map(_search_origin, origins, chunksize=chunksize)
+            write = write_csv if output_format == "csv" else write_jsonl
+            for result in write(results, out):
+                searched += 1
+                with_results += bool(result["viable_spots"])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"{searched} origins in {elapsed:.2f}s ({searched / elapsed if elapsed else 0:.1f} origins/s, "
+        f"{workers} workers); {with_results} with a matching spot",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""One Call の生 JSON と Forecast のメモリ使用量・コピーの速さを比較する。
+
+カタログ全件分の予報を両方の形式で持ったときの
+  - Python オブジェクトとしてのメモリ（tracemalloc）
+  - pickle したサイズと pickle/unpickle 1往復の時間（st.cache_data はヒットのたびにこれを行う）
+  - キャッシュに保存するサイズ（JSON 文字列 / Forecast.to_bytes）
+を表示する。
+
+    python benchmarks/bench_forecast_memory.py
+"""
+import json
+import os
+import pickle
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from forecast import parse_onecall  # noqa: E402
+from onecall_fixtures import make_onecall_payload  # noqa: E402
+from spot_catalog import SpotCatalog  # noqa: E402
+
+
+def traced_size(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objects, after - before
+
+
+def roundtrip_ms(objects):
+    return min(timeit.repeat(lambda: pickle.loads(pickle.dumps(objects)), number=5, repeat=3)) / 5 * 1000
+
+
+def main():
+    catalog = SpotCatalog.load()
+    now = time.time()
+    raw_json = [
+        json.dumps(make_onecall_payload(lat, lon, now, exclude=("minutely", "alerts", "daily")), ensure_ascii=False)
+        for lat, lon in zip(catalog.lats, catalog.lons)
+    ]
+
+    payloads, raw_bytes = traced_size(lambda: [json.loads(text) for text in raw_json])
+    forecasts, slim_bytes = traced_size(lambda: [parse_onecall(json.loads(text)) for text in raw_json])
+
+    raw_pickle = len(pickle.dumps(payloads))
+    slim_pickle = len(pickle.dumps(forecasts))
+    raw_stored = sum(len(text.encode("utf-8")) for text in raw_json)
+    slim_stored = sum(len(forecast.to_bytes()) for forecast in forecasts)
+
+    print(f"spots: {len(catalog)}")
+    print(f"{'':>24} {'raw JSON':>12} {'Forecast':>12} {'ratio':>8}")
+    for label, raw, slim in (
+        ("python objects (KiB)", raw_bytes / 1024, slim_bytes / 1024),
+        ("pickled (KiB)", raw_pickle / 1024, slim_pickle / 1024),
+        ("stored in cache (KiB)", raw_stored / 1024, slim_stored / 1024),
+        ("pickle roundtrip (ms)", roundtrip_ms(payloads), roundtrip_ms(forecasts)),
+    ):
+        print(f"{label:>24} {raw:>12.1f} {slim:>12.1f} {raw / slim:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""ローカルの One Call 代替サーバーに対して検索全体の速さと API の使用量を測る。
+
+代表的な出発地（東京・長野・那覇）とスライダーの組み合わせを、同時に使う
+セッション数や API の遅れ・エラーの割合を変えたシナリオごとに検索し、
+  - 検索1回あたりの時間（p50 / p95）
+  - 検索1回あたりの API 呼び出し数（サーバーに届いた HTTP リクエスト数・クライアントの呼び出し数）
+  - 予報キャッシュのヒット率
+を表示する。ネットワークには出ないので CI でも動く。
+
+    python benchmarks/bench_search.py
+    python benchmarks/bench_search.py --json baseline.json
+    python benchmarks/bench_search.py --baseline baseline.json --tolerance 0.2
+
+--baseline を指定すると、p95 か検索1回あたりの API 呼び出し数が基準より
+tolerance の割合を超えて悪くなったシナリオがあれば終了コード 1 で終わる。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from forecast_cache import ForecastCache, SQLiteBackend  # noqa: E402
+from mock_onecall_server import MockOneCallServer  # noqa: E402
+from search_core import cached_fetcher, search  # noqa: E402
+from spot_catalog import SpotCatalog  # noqa: E402
+from weather_client import OpenWeatherClient, create_session  # noqa: E402
+
+ORIGINS = {
+    "tokyo": (35.68, 139.76),
+    "nagano": (36.65, 138.18),
+    "naha": (26.21, 127.68),
+}
+# (目標の SQM, 雲量の上限, 表示件数, すべて調べるか)
+SETTINGS = {
+    "default": (19.0, 30, 3, False),
+    "dark-clear": (21.0, 10, 5, False),
+    "search-all": (19.0, 30, 3, True),
+}
+SCENARIOS = (
+    {"name": "serial", "sessions": 1, "latency": 0.05},
+    {"name": "concurrent", "sessions": 8, "latency": 0.05},
+    {"name": "slow-api", "sessions": 4, "latency": 0.3},
+    {"name": "flaky-api", "sessions": 4, "latency": 0.05, "error_rate": 0.1, "rate_limit_rate": 0.05},
+)
+
+
+def run_scenario(catalog, scenario, rounds, seed=0):
+    """1つのシナリオを空のキャッシュから実行し、集計結果を返す。"""
+    sessions = scenario["sessions"]
+    workload = [(origin, setting) for origin in ORIGINS for setting in SETTINGS] * rounds
+    with tempfile.TemporaryDirectory() as tmp, MockOneCallServer(
+        latency=scenario["latency"],
+        error_rate=scenario.get("error_rate", 0.0),
+        rate_limit_rate=scenario.get("rate_limit_rate", 0.0),
+        seed=seed,
+    ) as server:
+        cache = ForecastCache(SQLiteBackend(os.path.join(tmp, "forecasts.sqlite3")))
+        # 呼び出し回数の制限はベンチマークの邪魔になるので実質なしにする
+        client = OpenWeatherClient("bench", session=create_session(), calls_per_minute=10**6,
+                                   daily_limit=10**9, url=server.url)
+        fetch = cached_fetcher(cache, client)
+
+        def run_session(i):
+            jobs = list(workload)
+            random.Random(seed + i).shuffle(jobs)
+            latencies = []
+            for origin, setting in jobs:
+                desired_sqm, desired_cloud_cover, top_n, search_all = SETTINGS[setting]
+                started_at = time.perf_counter()
+                search(catalog, fetch, *ORIGINS[origin], desired_sqm, desired_cloud_cover,
+                       top_n=top_n, lazy=not search_all)
+                latencies.append(time.perf_counter() - started_at)
+            return latencies
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            latencies = [t for result in executor.map(run_session, range(sessions)) for t in result]
+        elapsed = time.perf_counter() - started_at
+        server_stats = server.stats()
+
+    client_stats = client.stats()
+    cache_stats = cache.stats()
+    searches = len(latencies)
+    return {
+        "name": scenario["name"],
+        "sessions": sessions,
+        "searches": searches,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "searches_per_s": searches / elapsed,
+        "http_requests_per_search": server_stats["requests"] / searches,
+        "api_calls_per_search": client_stats["calls"] / searches,
+        "cache_hit_rate": cache_stats["hit_rate"],
+        "coalesced": client_stats["coalesced"],
+        "failures": client_stats["failures"],
+        "http_429": server_stats.get(429, 0),
+        "http_500": server_stats.get(500, 0),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """基準より悪くなった項目を (シナリオ, 項目, 基準, 今回) のリストで返す。"""
+    previous = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        for metric in ("p95_ms", "api_calls_per_search"):
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append((result["name"], metric, before[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカルの One Call 代替サーバーで検索全体を計測する")
+    parser.add_argument("--rounds", type=int, default=2, help="各セッションが検索の組み合わせを何周するか")
+    parser.add_argument("--scenario", action="append", choices=[s["name"] for s in SCENARIOS],
+                        help="実行するシナリオ（複数指定可、省略時はすべて）")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    parser.add_argument("--baseline", help="比較する以前の結果（--json で保存したもの）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="基準から悪化してもよい割合")
+    args = parser.parse_args()
+
+    catalog = SpotCatalog.load()
+    scenarios = [s for s in SCENARIOS if not args.scenario or s["name"] in args.scenario]
+    results = []
+    print(f"{'scenario':>12} {'sess':>4} {'n':>4} {'p50 ms':>8} {'p95 ms':>8} {'search/s':>9} "
+          f"{'http/search':>11} {'api/search':>10} {'hit rate':>8} {'429':>4} {'500':>4} {'fail':>4}")
+    for scenario in scenarios:
+        result = run_scenario(catalog, scenario, args.rounds)
+        results.append(result)
+        print(f"{result['name']:>12} {result['sessions']:>4} {result['searches']:>4} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['searches_per_s']:>9.1f} "
+              f"{result['http_requests_per_search']:>11.2f} {result['api_calls_per_search']:>10.2f} "
+              f"{result['cache_hit_rate']:>8.0%} {result['http_429']:>4} {result['http_500']:>4} {result['failures']:>4}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, metric, before, after in regressions:
+            print(f"regression: {name} {metric} {before:.2f} -> {after:.2f}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
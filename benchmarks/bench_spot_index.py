@@ -0,0 +1,80 @@
+"""SpotIndex と従来の Python ループ（calculate_distance）の検索時間を比較する。
+
+日本付近にランダムな観測地を N 件並べたカタログを作り、
+半径検索と k 近傍検索の1回あたりの時間をカタログの大きさごとに表示する。
+
+    python benchmarks/bench_spot_index.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spot_index import SpotIndex  # noqa: E402
+from spot_search import calculate_distance  # noqa: E402
+
+SIZES = (170, 1_000, 10_000, 50_000)
+RADIUS_KM = 500
+K = 3
+# 東京駅付近から検索する
+ORIGIN = (35.68, 139.76)
+
+
+def make_catalog(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(24.0, 45.5, n)
+    lons = rng.uniform(123.0, 146.0, n)
+    return [{"name": f"spot-{i}", "lat": float(lat), "lon": float(lon)} for i, (lat, lon) in enumerate(zip(lats, lons))]
+
+
+def loop_radius(spots, lat, lon, radius_km):
+    nearby = []
+    for spot in spots:
+        distance = calculate_distance(lat, lon, spot["lat"], spot["lon"])
+        if distance <= radius_km:
+            nearby.append((distance, spot))
+    nearby.sort(key=lambda x: x[0])
+    return nearby
+
+
+def loop_nearest(spots, lat, lon, k):
+    distances = [(calculate_distance(lat, lon, spot["lat"], spot["lon"]), spot) for spot in spots]
+    distances.sort(key=lambda x: x[0])
+    return distances[:k]
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    lat, lon = ORIGIN
+    print(f"{'spots':>8} {'build ms':>9} {'loop radius us':>15} {'index radius us':>16} "
+          f"{'loop knn us':>12} {'index knn us':>13} {'hits':>6}")
+    for n in SIZES:
+        spots = make_catalog(n)
+        build_ms = per_call_us(lambda: SpotIndex.from_spots(spots), 3) / 1000
+        index = SpotIndex.from_spots(spots)
+
+        # 結果が従来のループと一致することを確かめてから計測する
+        expected = [spot["name"] for _, spot in loop_radius(spots, lat, lon, RADIUS_KM)]
+        indices, _ = index.query_radius(lat, lon, RADIUS_KM)
+        assert [spots[i]["name"] for i in indices] == expected
+        hits = len(indices)
+        expected = [spot["name"] for _, spot in loop_nearest(spots, lat, lon, K)]
+        indices, _ = index.query_nearest(lat, lon, K)
+        assert [spots[i]["name"] for i in indices] == expected
+
+        number = max(1, 20_000 // n)
+        loop_r = per_call_us(lambda: loop_radius(spots, lat, lon, RADIUS_KM), number)
+        index_r = per_call_us(lambda: index.query_radius(lat, lon, RADIUS_KM), number * 10)
+        loop_k = per_call_us(lambda: loop_nearest(spots, lat, lon, K), number)
+        index_k = per_call_us(lambda: index.query_nearest(lat, lon, K), number * 10)
+        print(f"{n:>8} {build_ms:>9.2f} {loop_r:>15.1f} {index_r:>16.1f} {loop_k:>12.1f} {index_k:>13.1f} {hits:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""One Call 3.0 の代わりに使うローカルの HTTP サーバー。
+
+onecall_fixtures の決まった内容を返し、応答の遅れ・エラー（5xx）・429 の割合を
+指定できる。ベンチマークからはスレッドで起動し、単体でも起動できる。
+
+    python benchmarks/mock_onecall_server.py --port 8080 --latency 0.2 --error-rate 0.05
+    OPENWEATHER_ONECALL_URL=http://127.0.0.1:8080/data/3.0/onecall streamlit run astro_app.py
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from onecall_fixtures import make_onecall_payload  # noqa: E402
+
+ONECALL_PATH = "/data/3.0/onecall"
+# 接続待ちの上限。既定の 5 では同時セッションやバッチのプロセスが多いときに溢れ、
+# クライアントが SYN の再送で約1秒止まり、その待ちが計測値に混ざる
+REQUEST_QUEUE_SIZE = 1024
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+    daemon_threads = True
+
+
+class MockOneCallServer:
+    """ThreadingHTTPServer を別スレッドで動かす One Call の代替。
+
+    latency       応答までの秒数（jitter の割合だけ前後にぶらす）
+    error_rate    500 を返す割合
+    rate_limit_rate  429（Retry-After: retry_after 秒）を返す割合
+    応答の内訳は stats() で、status ごとの回数として取り出せる。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.2, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._httpd = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{ONECALL_PATH}"
+
+    def serve_forever(self):
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-onecall", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["requests"] = sum(counts.values())
+        return counts
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts.clear()
+
+    def _outcome(self):
+        with self._lock:
+            roll = self._rng.random()
+            delay = self.latency * (1 + self.jitter * (2 * self._rng.random() - 1))
+        if roll < self.rate_limit_rate:
+            return 429, delay
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, delay
+        return 200, delay
+
+    def _record(self, status):
+        with self._lock:
+            self._counts[status] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path != ONECALL_PATH:
+                    return self._send(404, {"cod": 404, "message": "Not found"})
+                if not query.get("appid"):
+                    return self._send(401, {"cod": 401, "message": "Invalid API key."})
+                try:
+                    latitude, longitude = float(query["lat"]), float(query["lon"])
+                except (KeyError, ValueError):
+                    return self._send(400, {"cod": "400", "message": "wrong latitude"})
+
+                status, delay = server._outcome()
+                if delay > 0:
+                    time.sleep(delay)
+                if status == 429:
+                    return self._send(429, {"cod": 429, "message": "Too many requests"},
+                                      {"Retry-After": str(server.retry_after)})
+                if status != 200:
+                    return self._send(status, {"cod": status, "message": "Internal error"})
+                exclude = [block for block in query.get("exclude", "").split(",") if block]
+                self._send(200, make_onecall_payload(latitude, longitude, time.time(), exclude=exclude))
+
+            def _send(self, status, body, headers=None):
+                server._record(status)
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One Call 3.0 の代わりに決まった予報を返すローカルサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答までの秒数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500 を返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 を返す割合")
+    parser.add_argument("--retry-after", type=int, default=0, help="429 の Retry-After（秒）")
+    args = parser.parse_args()
+
+    server = MockOneCallServer(args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+                               rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after)
+    print(f"serving {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""ベンチマーク用の One Call 3.0 レスポンスを作る。
+
+実際の API と同じ項目（current / hourly 48件 / daily 8件）を持ち、
+同じ緯度経度と時刻からは常に同じ内容を返す。
+"""
+import random
+
+HOUR_SECONDS = 3600
+DAY_SECONDS = 86400
+
+
+def _weather(rng):
+    return [{"id": 803, "main": "Clouds", "description": rng.choice(["薄い雲", "曇りがち", "晴天"]), "icon": "04n"}]
+
+
+def _conditions(rng, dt, clouds):
+    return {
+        "dt": dt,
+        "temp": round(rng.uniform(-5, 30), 2),
+        "feels_like": round(rng.uniform(-8, 32), 2),
+        "pressure": rng.randint(990, 1030),
+        "humidity": rng.randint(20, 100),
+        "dew_point": round(rng.uniform(-10, 25), 2),
+        "uvi": 0,
+        "clouds": clouds,
+        "visibility": 10000,
+        "wind_speed": round(rng.uniform(0, 12), 2),
+        "wind_deg": rng.randint(0, 359),
+        "wind_gust": round(rng.uniform(0, 18), 2),
+        "weather": _weather(rng),
+    }
+
+
+def make_onecall_payload(latitude, longitude, now, seed=0, exclude=()):
+    """(緯度, 経度, 時刻) ごとに決まった内容の One Call レスポンスを返す。
+
+    exclude には API の exclude パラメータと同じく、省くブロック名を渡す。
+    """
+    rng = random.Random(f"{latitude:.4f},{longitude:.4f},{int(now) // HOUR_SECONDS},{seed}")
+    hour = int(now) // HOUR_SECONDS * HOUR_SECONDS
+    day = int(now) // DAY_SECONDS * DAY_SECONDS
+
+    clouds = []
+    level = rng.randint(0, 100)
+    for _ in range(48):
+        level = min(100, max(0, level + rng.randint(-20, 20)))
+        clouds.append(level)
+
+    current = _conditions(rng, int(now), clouds[0])
+    current.update({"sunrise": day - 6 * HOUR_SECONDS, "sunset": day + 8 * HOUR_SECONDS})
+    hourly = []
+    for i, cloud in enumerate(clouds):
+        entry = _conditions(rng, hour + i * HOUR_SECONDS, cloud)
+        entry["pop"] = round(rng.random(), 2)
+        hourly.append(entry)
+    daily = []
+    for i in range(8):
+        start = day + i * DAY_SECONDS
+        daily.append({
+            "dt": start + 3 * HOUR_SECONDS,
+            "sunrise": start - 6 * HOUR_SECONDS,
+            "sunset": start + 8 * HOUR_SECONDS,
+            "moonrise": start + rng.randint(0, DAY_SECONDS - 1),
+            "moonset": start + rng.randint(0, DAY_SECONDS - 1),
+            "moon_phase": round(rng.random(), 2),
+            "summary": "曇りの一日になるでしょう",
+            "temp": {k: round(rng.uniform(-5, 30), 2) for k in ("day", "min", "max", "night", "eve", "morn")},
+            "feels_like": {k: round(rng.uniform(-8, 32), 2) for k in ("day", "night", "eve", "morn")},
+            "pressure": rng.randint(990, 1030),
+            "humidity": rng.randint(20, 100),
+            "dew_point": round(rng.uniform(-10, 25), 2),
+            "wind_speed": round(rng.uniform(0, 12), 2),
+            "wind_deg": rng.randint(0, 359),
+            "wind_gust": round(rng.uniform(0, 18), 2),
+            "weather": _weather(rng),
+            "clouds": rng.randint(0, 100),
+            "pop": round(rng.random(), 2),
+            "uvi": round(rng.uniform(0, 10), 2),
+        })
+
+    payload = {
+        "lat": round(latitude, 4),
+        "lon": round(longitude, 4),
+        "timezone": "Asia/Tokyo",
+        "timezone_offset": 32400,
+        "current": current,
+        "hourly": hourly,
+        "daily": daily,
+    }
+    for block in exclude:
+        payload.pop(block, None)
+    return payload
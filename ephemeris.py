@@ -0,0 +1,167 @@
+import functools
+
+import numpy as np
+
+# --- 月と太陽の簡易暦 ---
+# 天体位置は「天文年鑑（Astronomical Almanac）」の低精度式による（誤差は月で約0.3度、
+# 月の出入りの時刻で最大7分程度、天文薄明で1分未満）。位置は観測地によらないので時刻ごとに1回だけ計算し、
+# 高度だけを 観測地 × 時刻 の行列としてまとめて求める。
+J2000_UNIX = 946728000  # 2000-01-01 12:00 UTC
+DAY_SECONDS = 86400
+# 出入り・薄明を探すときの時刻の刻み（秒）
+SAMPLE_SECONDS = 600
+# 天文薄明の太陽高度（度）
+ASTRONOMICAL_TWILIGHT = -18.0
+# 日本の観測地の「夜」は現地時刻の正午から翌日の正午までとする
+JST_OFFSET_SECONDS = 9 * 3600
+
+
+def _days(unix_times):
+    return (np.asarray(unix_times, dtype=np.float64) - J2000_UNIX) / DAY_SECONDS
+
+
+def _equatorial(lon_ecl, lat_ecl, days):
+    """黄道座標（ラジアン）を赤経・赤緯（ラジアン）に変換する。"""
+    eps = np.radians(23.439 - 0.0000004 * days)
+    sin_dec = np.sin(lat_ecl) * np.cos(eps) + np.cos(lat_ecl) * np.sin(eps) * np.sin(lon_ecl)
+    ra = np.arctan2(np.sin(lon_ecl) * np.cos(eps) - np.tan(lat_ecl) * np.sin(eps), np.cos(lon_ecl))
+    return ra, np.arcsin(sin_dec)
+
+
+def sun_position(unix_times):
+    """太陽の (赤経, 赤緯, 黄経)（ラジアン）。"""
+    d = _days(unix_times)
+    mean_lon = np.radians(280.460 + 0.9856474 * d)
+    anomaly = np.radians(357.528 + 0.9856003 * d)
+    lon = mean_lon + np.radians(1.915) * np.sin(anomaly) + np.radians(0.020) * np.sin(2 * anomaly)
+    ra, dec = _equatorial(lon, np.zeros_like(lon), d)
+    return ra, dec, lon
+
+
+def moon_position(unix_times):
+    """月の (赤経, 赤緯, 黄経, 黄緯, 地平視差)（ラジアン）。"""
+    d = _days(unix_times)
+    t = d / 36525
+
+    def term(a, b):
+        return np.radians(a + b * t)
+
+    lon = np.radians(
+        218.32 + 481267.881 * t
+        + 6.29 * np.sin(term(135.0, 477198.87)) - 1.27 * np.sin(term(259.3, -413335.36))
+        + 0.66 * np.sin(term(235.7, 890534.22)) + 0.21 * np.sin(term(269.9, 954397.74))
+        - 0.19 * np.sin(term(357.5, 35999.05)) - 0.11 * np.sin(term(186.5, 966404.03))
+    )
+    lat = np.radians(
+        5.13 * np.sin(term(93.3, 483202.02)) + 0.28 * np.sin(term(228.2, 960400.89))
+        - 0.28 * np.sin(term(318.3, 6003.15)) - 0.17 * np.sin(term(217.6, -407332.21))
+    )
+    parallax = np.radians(
+        0.9508 + 0.0518 * np.cos(term(135.0, 477198.87)) + 0.0095 * np.cos(term(259.3, -413335.36))
+        + 0.0078 * np.cos(term(235.7, 890534.22)) + 0.0028 * np.cos(term(269.9, 954397.74))
+    )
+    ra, dec = _equatorial(lon, lat, d)
+    return ra, dec, lon, lat, parallax
+
+
+def altitudes(ra, dec, unix_times, lats, lons):
+    """観測地 × 時刻 の高度（度）。ra / dec / unix_times は同じ長さ、lats / lons は観測地ごと。"""
+    gmst = np.radians(280.46061837 + 360.98564736629 * _days(unix_times))
+    hour_angle = gmst[None, :] + np.radians(np.asarray(lons, dtype=np.float64))[:, None] - ra[None, :]
+    phi = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    sin_alt = np.sin(phi) * np.sin(dec)[None, :] + np.cos(phi) * np.cos(dec)[None, :] * np.cos(hour_angle)
+    return np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+
+
+def moon_illumination(unix_times):
+    """月の輝面比（0 = 新月, 1 = 満月）。"""
+    _, _, sun_lon = sun_position(unix_times)
+    _, _, moon_lon, moon_lat, _ = moon_position(unix_times)
+    cos_elongation = np.cos(moon_lat) * np.cos(moon_lon - sun_lon)
+    return (1 - cos_elongation) / 2
+
+
+def _moon_horizon(parallax):
+    # 月の出入りの地心高度（視差・大気差・視半径を考慮、Meeus による）
+    return 0.7275 * np.degrees(parallax) - 0.5667
+
+
+def _first_crossing(times, alt, threshold, rising):
+    """各観測地で高度が threshold を最初に横切る時刻（UNIX 秒）。横切らなければ NaN。"""
+    above = alt >= threshold
+    if rising:
+        crossed = ~above[:, :-1] & above[:, 1:]
+    else:
+        crossed = above[:, :-1] & ~above[:, 1:]
+    has = crossed.any(axis=1)
+    j = np.argmax(crossed, axis=1)
+    rows = np.arange(alt.shape[0])
+    threshold = np.broadcast_to(threshold, alt.shape)
+    a0 = alt[rows, j] - threshold[rows, j]
+    a1 = alt[rows, j + 1] - threshold[rows, j + 1]
+    fraction = np.where(a1 != a0, a0 / (a0 - a1), 0.0)
+    t = times[j] + fraction * (times[j + 1] - times[j])
+    return np.where(has, t, np.nan)
+
+
+def night_start(unix_time, utc_offset=JST_OFFSET_SECONDS):
+    """unix_time を含む「夜」（現地の正午〜翌日の正午）の始まりの時刻。"""
+    local = int(unix_time) + utc_offset
+    return (local - 43200) // DAY_SECONDS * DAY_SECONDS + 43200 - utc_offset
+
+
+def night_events(lats, lons, start):
+    """start から24時間の、観測地ごとの月の出・月の入り・天文薄明の時刻と月の輝面比。
+
+    返す辞書の時刻は UNIX 秒の配列で、その夜に起きない現象は NaN。
+      moonrise / moonset   月の出・月の入り
+      dusk / dawn          天文薄明の終わり（暗くなる）・始まり（明るくなる）
+      illumination         真夜中の月の輝面比（全観測地で共通）
+    """
+    times = start + SAMPLE_SECONDS * np.arange(DAY_SECONDS // SAMPLE_SECONDS + 1, dtype=np.float64)
+    sun_ra, sun_dec, _ = sun_position(times)
+    moon_ra, moon_dec, _, _, parallax = moon_position(times)
+    sun_alt = altitudes(sun_ra, sun_dec, times, lats, lons)
+    moon_alt = altitudes(moon_ra, moon_dec, times, lats, lons)
+    moon_horizon = _moon_horizon(parallax)[None, :]
+    return {
+        "moonrise": _first_crossing(times, moon_alt, moon_horizon, rising=True),
+        "moonset": _first_crossing(times, moon_alt, moon_horizon, rising=False),
+        "dusk": _first_crossing(times, sun_alt, ASTRONOMICAL_TWILIGHT, rising=False),
+        "dawn": _first_crossing(times, sun_alt, ASTRONOMICAL_TWILIGHT, rising=True),
+        "illumination": float(moon_illumination(start + DAY_SECONDS / 2)),
+    }
+
+
+@functools.lru_cache(maxsize=4)
+def catalog_night_events(catalog, start):
+    """カタログ全件の night_events。夜（start）ごとにキャッシュする。"""
+    return night_events(catalog.lats, catalog.lons, start)
+
+
+def tonight_events(catalog, now):
+    """now の時点で「今夜」にあたる、カタログ全件の月の出入り・天文薄明。
+
+    正午で区切った夜（night_start）のうち、朝の天文薄明が始まって夜が明けた
+    スポットは、その日の夕方からの次の夜の値にする。illumination もスポットごとの配列。
+    """
+    start = night_start(now)
+    current = catalog_night_events(catalog, start)
+    upcoming = catalog_night_events(catalog, start + DAY_SECONDS)
+    dawned = current["dawn"] <= now
+    events = {key: np.where(dawned, upcoming[key], current[key]) for key in ("moonrise", "moonset", "dusk", "dawn")}
+    events["illumination"] = np.where(dawned, upcoming["illumination"], current["illumination"])
+    return events
+
+
+def sky_matrices(lats, lons, slots, slot_seconds=3600):
+    """観測地 × 時間 の (月が出ているか, 天文薄明が終わって暗いか, 月の輝面比)。
+
+    各時間の中央の時刻で判定する。
+    """
+    mid = np.asarray(slots, dtype=np.float64) + slot_seconds / 2
+    moon_ra, moon_dec, _, _, parallax = moon_position(mid)
+    sun_ra, sun_dec, _ = sun_position(mid)
+    moon_up = altitudes(moon_ra, moon_dec, mid, lats, lons) >= _moon_horizon(parallax)[None, :]
+    dark = altitudes(sun_ra, sun_dec, mid, lats, lons) < ASTRONOMICAL_TWILIGHT
+    return moon_up, dark, moon_illumination(mid)
@@ -0,0 +1,56 @@
+import struct
+
+import numpy as np
+
+HOUR_SECONDS = 3600
+# 取得時刻, 現在の雲量, 1時間予報の先頭時刻
+_HEADER = struct.Struct("<qBq")
+
+
+class Forecast:
+    """One Call のレスポンスから、アプリが使う値だけを取り出した予報。
+
+    hourly_clouds[i] は hourly_start + i 時間の雲量（%）。
+    """
+
+    __slots__ = ("observed_at", "current_clouds", "hourly_start", "hourly_clouds")
+
+    def __init__(self, observed_at, current_clouds, hourly_start, hourly_clouds):
+        self.observed_at = observed_at
+        self.current_clouds = current_clouds
+        self.hourly_start = hourly_start
+        self.hourly_clouds = np.asarray(hourly_clouds, dtype=np.uint8)
+        self.hourly_clouds.flags.writeable = False
+
+    def __repr__(self):
+        return (f"Forecast(observed_at={self.observed_at}, current_clouds={self.current_clouds}, "
+                f"hours={len(self.hourly_clouds)})")
+
+    def hourly_times(self):
+        return self.hourly_start + HOUR_SECONDS * np.arange(len(self.hourly_clouds), dtype=np.int64)
+
+    def to_bytes(self):
+        header = _HEADER.pack(self.observed_at, self.current_clouds, self.hourly_start)
+        return header + self.hourly_clouds.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        observed_at, current_clouds, hourly_start = _HEADER.unpack_from(data)
+        hourly_clouds = np.frombuffer(data, dtype=np.uint8, offset=_HEADER.size)
+        return cls(observed_at, current_clouds, hourly_start, hourly_clouds)
+
+
+def parse_onecall(payload):
+    """One Call 3.0 の JSON を Forecast に変換する。必要な値が欠けていれば None を返す。"""
+    try:
+        current = payload["current"]
+        hourly = payload.get("hourly") or []
+        hourly_start = hourly[0]["dt"] if hourly else current["dt"]
+        return Forecast(
+            observed_at=int(current["dt"]),
+            current_clouds=int(current["clouds"]),
+            hourly_start=int(hourly_start),
+            hourly_clouds=[hour["clouds"] for hour in hourly],
+        )
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
@@ -0,0 +1,337 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from forecast import Forecast
+
+# --- 天気予報キャッシュの設定 ---
+DEFAULT_CACHE_PATH = os.environ.get(
+    "HOSHIDOKO_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "forecasts.sqlite3"),
+)
+# OpenWeather の予報は約10分ごとに更新される。同じ更新周期内に取得した予報は新鮮とみなす
+CYCLE_SECONDS = 600
+# 周期を過ぎた予報でも、この時間内なら先に返して裏で取り直す
+MAX_STALE_SECONDS = 3 * 60 * 60
+REFRESH_WORKERS = 2
+# 同じスポットを別のプロセスが取得中なら、保存されるのを待つ。
+# 取得中の印（claim）はこの秒数で切れる（取得中にプロセスが落ちた場合）
+CLAIM_LEASE_SECONDS = 30
+CLAIM_POLL_SECONDS = 0.05
+# 保存形式を変えたら上げる。古い形式のテーブルは作り直す
+SCHEMA_VERSION = 3
+
+
+def forecast_cycle(timestamp):
+    return int(timestamp // CYCLE_SECONDS)
+
+
+def spot_key(latitude, longitude):
+    return f"{latitude:.4f},{longitude:.4f}"
+
+
+class MemoryBackend:
+    """プロセス内だけで共有する保存先（テストやキャッシュファイルを置けない環境向け）。"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def store(self, key, cycle, fetched_at, payload):
+        with self._lock:
+            self._entries[key] = (cycle, fetched_at, payload)
+
+    def fetched_times(self):
+        with self._lock:
+            return {key: entry[1] for key, entry in self._entries.items()}
+
+    def claim(self, key, lease):
+        # プロセス内の同時取得は OpenWeatherClient の SingleFlight がまとめる
+        return True
+
+    def release(self, key):
+        pass
+
+
+class SQLiteBackend:
+    """SQLite（WAL モード）の保存先。再起動後も残り、同じファイルを使うプロセス間で共有される。
+
+    claims テーブルで「どのプロセスがどのスポットを取得中か」を共有し、
+    複数のプロセスが同じスポットを同時に API へ問い合わせないようにする。
+    api_usage テーブルには1日ごとの API 呼び出し回数を、rate_limits テーブルには
+    トークンバケットの残りを数える（weather_client.SharedDailyQuota / SharedTokenBucket が使う）。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        # 同じプロセスの別スレッドからの claim は同じ持ち主として扱う
+        self.owner = uuid.uuid4().hex
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS forecasts")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS forecasts ("
+                " spot TEXT PRIMARY KEY,"
+                " cycle INTEGER NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " payload BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS claims ("
+                " spot TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS api_usage (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " name TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite3 の接続はスレッドをまたいで使えないので、スレッドごとに持つ
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key):
+        row = self._connect().execute(
+            "SELECT cycle, fetched_at, payload FROM forecasts WHERE spot = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], Forecast.from_bytes(row[2])
+
+    def store(self, key, cycle, fetched_at, payload):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO forecasts (spot, cycle, fetched_at, payload) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(spot) DO UPDATE SET"
+                " cycle = excluded.cycle, fetched_at = excluded.fetched_at, payload = excluded.payload"
+                " WHERE excluded.fetched_at > forecasts.fetched_at",
+                (key, cycle, fetched_at, payload.to_bytes()),
+            )
+
+    def fetched_times(self):
+        return dict(self._connect().execute("SELECT spot, fetched_at FROM forecasts"))
+
+    def claim(self, key, lease):
+        """key の取得中の印を lease 秒つける。他のプロセスが取得中なら False。"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO claims (spot, owner, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(spot) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                " WHERE claims.expires_at < ? OR claims.owner = excluded.owner",
+                (key, self.owner, now + lease, now),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM claims WHERE spot = ? AND owner = ?", (key, self.owner))
+
+    def consume_call(self, day, limit):
+        """day の呼び出し回数を1つ増やす。すでに limit 回に達していれば増やさずに False を返す。"""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO api_usage (day, used) VALUES (?, 0)", (day,))
+            cursor = conn.execute("UPDATE api_usage SET used = used + 1 WHERE day = ? AND used < ?", (day, limit))
+        return cursor.rowcount == 1
+
+    def calls_on(self, day):
+        row = self._connect().execute("SELECT used FROM api_usage WHERE day = ?", (day,)).fetchone()
+        return row[0] if row else 0
+
+    def take_token(self, name, rate, capacity):
+        """トークンバケット name（rate 個/秒で補充、最大 capacity 個）から1つ取る。
+
+        取れたら 0 を、足りなければ次の1つが貯まるまでの秒数を返す。
+        """
+        now = time.time()
+        # 前回からの補充分を足した残り（時計が戻っても減らさない）
+        refilled = "MIN(:capacity, tokens + MAX(:now - updated_at, 0) * :rate)"
+        params = {"name": name, "rate": rate, "capacity": capacity, "now": now}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO rate_limits (name, tokens, updated_at) VALUES (:name, :capacity, :now)", params
+            )
+            cursor = conn.execute(
+                f"UPDATE rate_limits SET tokens = {refilled} - 1, updated_at = :now"
+                f" WHERE name = :name AND {refilled} >= 1",
+                params,
+            )
+            if cursor.rowcount == 1:
+                return 0.0
+            tokens = conn.execute(f"SELECT {refilled} FROM rate_limits WHERE name = :name", params).fetchone()[0]
+        return (1 - tokens) / rate
+
+    def close(self):
+        """このスレッドの接続を閉じる（fork する前の親プロセスなどで使う）。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class ForecastCache:
+    """スポットごとの予報（Forecast）を保存し、古くなった予報は先に返してから裏で取り直すキャッシュ。
+
+    get() の判定:
+      新鮮   保存された予報が現在の更新周期のもの -> そのまま返す
+      古い   周期は過ぎたが max_stale 秒以内 -> そのまま返し、裏で取り直す
+      なし   保存がない・古すぎる -> その場で取得して保存する
+    その場での取得に失敗した場合（API の上限到達など）は、古すぎる予報でも
+    保存があればそれを返す（fallbacks として数える）。
+    取得の前に backend.claim() を取り、別のプロセスが同じスポットを取得中なら
+    その予報が保存されるのを待って使う（claim_waits として数える）。
+    """
+
+    def __init__(self, backend=None, max_stale=MAX_STALE_SECONDS, refresh_workers=REFRESH_WORKERS,
+                 claim_lease=CLAIM_LEASE_SECONDS):
+        self.backend = backend if backend is not None else SQLiteBackend()
+        self.max_stale = max_stale
+        self.claim_lease = claim_lease
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="forecast-refresh")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "fallbacks": 0,
+            "claim_waits": 0,
+            "stale_seconds_total": 0.0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["lookups"] = lookups
+        stats["hit_rate"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        stats["mean_stale_seconds"] = stats["stale_seconds_total"] / stats["stale_hits"] if stats["stale_hits"] else 0.0
+        return stats
+
+    def peek(self, latitude, longitude):
+        """保存されている予報を (取得時刻, 予報) で返す。取得は行わない。"""
+        entry = self.backend.load(spot_key(latitude, longitude))
+        if entry is None:
+            return None
+        return entry[1], entry[2]
+
+    def fetched_times(self):
+        """保存されている全スポットの取得時刻を {spot_key: 取得時刻} で返す。"""
+        return self.backend.fetched_times()
+
+    def put(self, latitude, longitude, payload, fetched_at=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        self.backend.store(spot_key(latitude, longitude), forecast_cycle(fetched_at), fetched_at, payload)
+
+    def get(self, latitude, longitude, loader):
+        """予報を返す。loader() は予報を取得する関数（失敗時は None）。"""
+        key = spot_key(latitude, longitude)
+        now = time.time()
+        entry = self.backend.load(key)
+        if entry is not None:
+            cycle, fetched_at, payload = entry
+            if cycle >= forecast_cycle(now):
+                self._count("hits")
+                return payload
+            if now - fetched_at <= self.max_stale:
+                self._count("stale_hits")
+                self._count("stale_seconds_total", now - fetched_at)
+                self._refresh_in_background(key, latitude, longitude, loader)
+                return payload
+
+        self._count("misses")
+        stored = self._claim_or_wait(key, entry)
+        if stored is not None:
+            return stored
+        try:
+            payload = loader()
+            if payload is not None:
+                self.put(latitude, longitude, payload)
+        finally:
+            self.backend.release(key)
+        if payload is None and entry is not None:
+            self._count("fallbacks")
+            return entry[2]
+        return payload
+
+    def _claim_or_wait(self, key, entry):
+        """取得中の印を取れたら None を返す。別のプロセスが取得中なら、
+        その予報が保存されるのを待って返す（取得をあきらめて印が外れたら、こちらで取得する）。"""
+        waited = False
+        while not self.backend.claim(key, self.claim_lease):
+            if not waited:
+                self._count("claim_waits")
+                waited = True
+            time.sleep(CLAIM_POLL_SECONDS)
+            latest = self._newer(key, entry)
+            if latest is not None:
+                return latest
+        if waited:
+            # 印が外れた直前に保存されていれば、それを使う
+            latest = self._newer(key, entry)
+            if latest is not None:
+                self.backend.release(key)
+                return latest
+        return None
+
+    def _newer(self, key, entry):
+        latest = self.backend.load(key)
+        if latest is not None and (entry is None or latest[1] > entry[1]):
+            return latest[2]
+        return None
+
+    def _refresh_in_background(self, key, latitude, longitude, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            if not self.backend.claim(key, self.claim_lease):
+                # 別のプロセスが取り直している
+                with self._lock:
+                    self._refreshing.discard(key)
+                return
+            try:
+                payload = loader()
+                if payload is None:
+                    self._count("refresh_failures")
+                else:
+                    self.put(latitude, longitude, payload)
+                    self._count("refreshes")
+            except Exception:
+                self._count("refresh_failures")
+            finally:
+                self.backend.release(key)
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
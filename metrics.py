@@ -0,0 +1,167 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+# --- 処理時間と回数の計測 ---
+# 既定では無効。環境変数 HOSHIDOKO_METRICS=1（アプリでは secrets の METRICS_ENABLED）で有効にする。
+# 無効なときの span() / incr() は何も記録しない。
+METRICS_PREFIX = "hoshidoko"
+# 分位点（p50 / p95）の計算に使う、区間ごとの直近の計測数
+SAMPLE_SIZE = 1024
+QUANTILES = (0.5, 0.95)
+
+logger = logging.getLogger("hoshidoko.metrics")
+
+
+def _enable_request_log():
+    """検索ごとのログ（INFO）が出力されるようにする。
+
+    ロガーの既定の出力先は WARNING 以上しか表示しないので、レベルを INFO にし、
+    アプリ側で出力先が設定されていなければ標準エラーへの出力先を付ける。
+    """
+    logger.setLevel(logging.INFO)
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ("_metrics", "_name", "_trace", "_started_at")
+
+    def __init__(self, metrics, name, trace):
+        self._metrics = metrics
+        self._name = name
+        self._trace = trace
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.observe(self._name, time.perf_counter() - self._started_at, self._trace)
+        if exc_type is not None:
+            self._metrics.incr(f"{self._name}_errors")
+        return False
+
+
+class Metrics:
+    """区間ごとの処理時間と、名前ごとの回数を数える（プロセス全体で共有する）。
+
+    with metrics.span("distance_scan"): ...  のように使う。trace に辞書を渡すと、
+    1回の検索の中での区間ごとの合計時間もそこへ足していく（log_request で書き出す）。
+    """
+
+    def __init__(self, enabled=False, sample_size=SAMPLE_SIZE):
+        self._enabled = False
+        self.enabled = enabled
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = {}
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        if value and not self._enabled:
+            _enable_request_log()
+        self._enabled = bool(value)
+
+    def span(self, name, trace=None):
+        if not self._enabled:
+            return _NULL_SPAN
+        return _Span(self, name, trace)
+
+    def incr(self, name, amount=1):
+        if not self._enabled:
+            return
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name, seconds, trace=None):
+        """区間 name に seconds 秒かかったことを記録する。"""
+        if not self._enabled:
+            return
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + seconds
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                                "samples": deque(maxlen=self.sample_size)}
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            timing["samples"].append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+    def snapshot(self):
+        """{"counters": {名前: 回数}, "spans": {名前: {count, sum, max, p50, p95}}} を返す（秒）。"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: dict(timing, samples=list(timing["samples"])) for name, timing in self._timings.items()}
+        spans = {}
+        for name, timing in timings.items():
+            quantiles = np.quantile(timing["samples"], QUANTILES) if timing["samples"] else [0.0] * len(QUANTILES)
+            spans[name] = {
+                "count": timing["count"],
+                "sum": timing["sum"],
+                "max": timing["max"],
+                **{f"p{int(q * 100)}": float(value) for q, value in zip(QUANTILES, quantiles)},
+            }
+        return {"counters": counters, "spans": spans}
+
+    def prometheus_text(self, gauges=None):
+        """Prometheus のテキスト形式で書き出す。
+
+        gauges には {グループ名: {名前: 値}}（ForecastCache.stats() など）を渡せる。
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{METRICS_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        if snapshot["spans"]:
+            metric = f"{METRICS_PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, span in sorted(snapshot["spans"].items()):
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{span="{name}",quantile="{q}"}} {span[f"p{int(q * 100)}"]:.6f}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {span["sum"]:.6f}')
+                lines.append(f'{metric}_count{{span="{name}"}} {span["count"]}')
+            lines.append(f"# TYPE {metric}_max gauge")
+            for name, span in sorted(snapshot["spans"].items()):
+                lines.append(f'{metric}_max{{span="{name}"}} {span["max"]:.6f}')
+        for group, values in sorted((gauges or {}).items()):
+            for name, value in sorted(values.items()):
+                if isinstance(value, (bool, int, float)):
+                    metric = f"{METRICS_PREFIX}_{group}_{name}"
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {float(value):g}"]
+        return "\n".join(lines) + "\n"
+
+    def log_request(self, trace, **fields):
+        """1回の検索の区間ごとの時間（ミリ秒）を JSON 1行のログとして書き出す。"""
+        if not self._enabled:
+            return
+        record = {"event": "search", **fields, "spans_ms": {name: round(s * 1000, 2) for name, s in trace.items()}}
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+# プロセス全体で共有する計測器
+METRICS = Metrics(enabled=os.environ.get("HOSHIDOKO_METRICS") == "1")
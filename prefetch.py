@@ -0,0 +1,167 @@
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from forecast_cache import CYCLE_SECONDS, MAX_STALE_SECONDS, forecast_cycle, spot_key
+from spot_catalog import sqm_darkness
+from spot_index import haversine_km
+from weather_client import fetch_all
+
+# --- 先読みの設定 ---
+# One Call 3.0 の無料枠は1日1000回。検索時の取得分を残して先読みに使う回数
+DAILY_CALL_BUDGET = 800
+# 最近の検索地点をいくつ覚えておくか
+RECENT_ORIGINS = 50
+# 検索地点からこの距離（km）程度までのスポットを優先する
+ORIGIN_SCALE_KM = 300
+
+
+def _utc_day(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+
+
+class PrefetchScheduler:
+    """全スポットの予報を裏で取り直し、キャッシュを温めておくワーカー。
+
+    予報の更新周期（CYCLE_SECONDS）ごとに、今の周期の予報を持っていない
+    スポットを優先度順に取り直す。1日の呼び出し回数が daily_budget を
+    超えないよう、残りの回数を日付が変わる（UTC）までの周期に均等に割り振る。
+
+    優先度 = 空の暗さ + 最近の検索地点への近さ + 予報の古さ
+
+    quota に検索と共有する DailyQuota（OpenWeatherClient.quota）を渡すと、
+    その残りが quota.limit - daily_budget 回を下回らないようにする
+    （検索での呼び出しが多い日に、先読みが検索の分を使い切らない）。
+    """
+
+    def __init__(self, catalog, cache, fetch, daily_budget=DAILY_CALL_BUDGET, interval=CYCLE_SECONDS,
+                 quota=None):
+        self.catalog = catalog
+        self.cache = cache
+        self.fetch = fetch
+        self.daily_budget = daily_budget
+        self.interval = interval
+        self.quota = quota
+        self._darkness = sqm_darkness(catalog.sqm_levels)
+        self._keys = [spot_key(lat, lon) for lat, lon in zip(catalog.lats, catalog.lons)]
+        # (更新周期, その周期の予報を持っているスポット数)。status() は再実行のたびに呼ばれるので周期ごとに数える
+        self._warm = None
+        self._origins = deque(maxlen=RECENT_ORIGINS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._day = _utc_day(time.time())
+        self.calls_today = 0
+        self.failures_today = 0
+        self.last_refresh_at = None
+        self.last_refreshed = 0
+
+    def record_search(self, latitude, longitude):
+        with self._lock:
+            self._origins.append((latitude, longitude))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="forecast-prefetch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # 1回の失敗でワーカーを止めない。次の周期で取り直す
+                pass
+            self._stop.wait(self.interval)
+
+    def _allowance(self, now):
+        day = _utc_day(now)
+        if day != self._day:
+            self._day = day
+            self.calls_today = 0
+            self.failures_today = 0
+        remaining = self.daily_budget - self.calls_today
+        if self.quota is not None:
+            remaining = min(remaining, self.quota.remaining() - max(self.quota.limit - self.daily_budget, 0))
+        if remaining <= 0:
+            return 0
+        seconds_left = 86400 - (now % 86400)
+        passes_left = max(1, math.ceil(seconds_left / self.interval))
+        return math.ceil(remaining / passes_left)
+
+    def _fetched_at(self):
+        """各スポットの予報の取得時刻（保存がなければ -inf）。"""
+        fetched_times = self.cache.fetched_times()
+        return np.array([fetched_times.get(key, -np.inf) for key in self._keys], dtype=float)
+
+    def priorities(self, now=None):
+        """各スポットの優先度と、今の周期の予報を既に持っているかを返す。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            origins = list(self._origins)
+        proximity = np.zeros(len(self.catalog))
+        for lat, lon in origins:
+            distances = haversine_km(lat, lon, self.catalog.lats, self.catalog.lons)
+            proximity = np.maximum(proximity, np.exp(-distances / ORIGIN_SCALE_KM))
+
+        fetched_at = self._fetched_at()
+        age = np.minimum(now - fetched_at, MAX_STALE_SECONDS)
+        fresh = fetched_at >= forecast_cycle(now) * CYCLE_SECONDS
+        return self._darkness + proximity + age / MAX_STALE_SECONDS, fresh
+
+    def run_once(self, now=None):
+        """1周期分の取り直しを行い、取り直したスポット数を返す。"""
+        now = time.time() if now is None else now
+        allowance = self._allowance(now)
+        if allowance <= 0:
+            return 0
+        priority, fresh = self.priorities(now)
+        self._warm = (forecast_cycle(now), int(fresh.sum()))
+        order = [i for i in np.argsort(-priority, kind="stable") if not fresh[i]][:allowance]
+        if not order:
+            return 0
+
+        targets = [self.catalog.spot(i) for i in order]
+        self.calls_today += len(targets)
+        results = fetch_all(targets, lambda spot: self.fetch(spot["lat"], spot["lon"]))
+        refreshed = 0
+        for spot, payload in zip(targets, results):
+            if payload is None:
+                self.failures_today += 1
+                continue
+            self.cache.put(spot["lat"], spot["lon"], payload)
+            refreshed += 1
+        self.last_refresh_at = time.time()
+        self.last_refreshed = refreshed
+        self._warm = (forecast_cycle(now), int(fresh.sum()) + refreshed)
+        return refreshed
+
+    def warm_spots(self, now=None):
+        """今の周期の予報を持っているスポット数。周期の最初の1回だけキャッシュを数え、
+        その後は run_once で取り直した分を足していく（検索で取得した分は次の周期に反映される）。"""
+        now = time.time() if now is None else now
+        cycle = forecast_cycle(now)
+        warm = self._warm
+        if warm is None or warm[0] != cycle:
+            warm = self._warm = (cycle, int((self._fetched_at() >= cycle * CYCLE_SECONDS).sum()))
+        return warm[1]
+
+    def status(self):
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_refresh_at": self.last_refresh_at,
+            "last_refreshed": self.last_refreshed,
+            "calls_today": self.calls_today,
+            "failures_today": self.failures_today,
+            "daily_budget": self.daily_budget,
+            "warm_spots": self.warm_spots(),
+            "total_spots": len(self.catalog),
+        }
@@ -0,0 +1,97 @@
+import numpy as np
+
+from ephemeris import sky_matrices
+from forecast import HOUR_SECONDS
+from spot_catalog import sqm_darkness
+from spot_search import DEFAULT_TOP_N, estimate_travel_hours
+
+# --- 「いつ・どこへ行くか」の採点 ---
+# これから何時間先までの到着時刻を考えるか（One Call の1時間予報は48時間分）
+DEFAULT_HORIZON_HOURS = 24
+# 満月が出ている時間帯は点数をこの割合だけ下げる（輝面比に比例）
+MOON_PENALTY = 0.5
+# 移動時間がこの時間（h）増えるごとに点数が 1/e になる
+TRAVEL_SCALE_HOURS = 3.0
+
+
+def hour_slots(now, horizon_hours=DEFAULT_HORIZON_HOURS):
+    """now を含む1時間から horizon_hours 個分の、各時間の開始時刻（UNIX 秒）。"""
+    start = int(now) // HOUR_SECONDS * HOUR_SECONDS
+    return start + HOUR_SECONDS * np.arange(horizon_hours, dtype=np.int64)
+
+
+def cloud_matrix(forecasts, slots):
+    """スポット × 時間の雲量（%）の行列。予報がない箇所は NaN。"""
+    n_hours = max((len(f.hourly_clouds) for f in forecasts if f is not None), default=0)
+    clouds = np.full((len(forecasts), n_hours + 1), np.nan)
+    starts = np.zeros(len(forecasts), dtype=np.int64)
+    for i, forecast in enumerate(forecasts):
+        if forecast is not None:
+            clouds[i, :len(forecast.hourly_clouds)] = forecast.hourly_clouds
+            starts[i] = forecast.hourly_start
+    # 予報の範囲外は最後の列（NaN）を参照させる
+    offsets = (slots[None, :] - starts[:, None]) // HOUR_SECONDS
+    offsets = np.where((offsets >= 0) & (offsets < n_hours), offsets, n_hours)
+    return np.take_along_axis(clouds, offsets, axis=1)
+
+
+def score_windows(sqm_levels, distances_km, clouds, moon_up, dark, illumination, slots, now):
+    """スポット × 時間の点数（0〜1）を一度に計算する。
+
+    着けない時間・予報のない時間・天文薄明が終わっていない時間は -inf。
+    """
+    sqm_levels = np.asarray(sqm_levels, dtype=np.float64)[:, None]
+    travel_hours = estimate_travel_hours(np.asarray(distances_km, dtype=np.float64))[:, None]
+    darkness = sqm_darkness(sqm_levels)
+    clear = 1.0 - clouds / 100.0
+    moon = 1.0 - MOON_PENALTY * moon_up * np.asarray(illumination)[None, :]
+    travel = np.exp(-travel_hours / TRAVEL_SCALE_HOURS)
+    score = clear * (0.5 + 0.5 * darkness) * moon * travel
+    reachable = slots[None, :] + HOUR_SECONDS > now + travel_hours * HOUR_SECONDS
+    return np.where(reachable & dark & ~np.isnan(clouds), score, -np.inf)
+
+
+def rank_windows(spots, forecasts, now, desired_cloud_cover=100, top_n=DEFAULT_TOP_N,
+                 horizon_hours=DEFAULT_HORIZON_HOURS, per_spot=True):
+    """保存済みの予報から、点数の高い (スポット, 到着する時間) の組を返す。
+
+    spots は find_nearby_spots が返す辞書（distance と sqm_level を持つ）、
+    forecasts は同じ順番の Forecast（ない場合は None）。
+    雲量が desired_cloud_cover を超える時間は候補にしない。
+    per_spot=True のときは、スポットごとに一番良い時間だけを候補にする。
+    """
+    if not spots:
+        return []
+    slots = hour_slots(now, horizon_hours)
+    clouds = cloud_matrix(forecasts, slots)
+    moon_up, dark, illumination = sky_matrices(
+        [spot["lat"] for spot in spots], [spot["lon"] for spot in spots], slots,
+    )
+    score = score_windows(
+        [spot["sqm_level"] for spot in spots], [spot["distance"] for spot in spots],
+        clouds, moon_up, dark, illumination, slots, now,
+    )
+    score = np.where(clouds <= desired_cloud_cover, score, -np.inf)
+
+    if per_spot:
+        best_hour = np.argmax(score, axis=1)
+        candidates = np.stack([np.arange(len(spots)), best_hour], axis=1)
+    else:
+        candidates = np.argwhere(np.isfinite(score))
+    values = score[candidates[:, 0], candidates[:, 1]]
+    keep = np.isfinite(values)
+    candidates, values = candidates[keep], values[keep]
+    order = np.argsort(-values, kind="stable")[:top_n]
+
+    plans = []
+    for i, h in candidates[order]:
+        plans.append({
+            **spots[i],
+            "arrival_slot": int(slots[h]),
+            "score": float(score[i, h]),
+            "clouds": int(clouds[i, h]),
+            "moon_up": bool(moon_up[i, h]),
+            "moon_illumination": float(illumination[h]),
+            "travel_hours": float(estimate_travel_hours(spots[i]["distance"])),
+        })
+    return plans
@@ -0,0 +1,101 @@
+import math
+import time
+
+from ephemeris import tonight_events
+from scoring import DEFAULT_HORIZON_HOURS, rank_windows
+from spot_search import DEFAULT_TOP_N, SEARCH_RADIUS_KM, find_nearby_spots, search_viable_spots
+from weather_client import MAX_WORKERS
+
+# --- Streamlit に依存しない検索処理 ---
+# アプリ（astro_app.py）と一括検索（batch_search.py）の両方から使う
+
+
+def cached_fetcher(cache, client):
+    """キャッシュを通して予報を取る fetch(latitude, longitude) を返す。"""
+    def fetch(latitude, longitude):
+        return cache.get(latitude, longitude, lambda: client.fetch(latitude, longitude))
+    return fetch
+
+
+def cache_only_fetcher(cache):
+    """保存済みの予報だけを返す fetch(latitude, longitude) を返す（API は呼ばない）。"""
+    def fetch(latitude, longitude):
+        entry = cache.peek(latitude, longitude)
+        return entry[1] if entry else None
+    return fetch
+
+
+def _timestamp(value):
+    return None if math.isnan(value) else int(value)
+
+
+def search(catalog, fetch, latitude, longitude, desired_sqm, desired_cloud_cover,
+           top_n=DEFAULT_TOP_N, radius_km=SEARCH_RADIUS_KM, lazy=True,
+           horizon_hours=DEFAULT_HORIZON_HOURS, now=None, max_workers=MAX_WORKERS):
+    """1つの出発地について、条件に合うスポットと「いつ・どこ」のおすすめを返す。
+
+    fetch(latitude, longitude) は Forecast（失敗時は None）を返す関数。
+    戻り値は JSON にそのまま書き出せる辞書:
+      candidates     半径内の候補地の数
+      viable_spots   条件に合ったスポット（近い順、最大 top_n 件）。今夜の月の出入り・天文薄明の時刻付き
+      unknown_spots  天気情報を取得できなかったスポットの名前
+      fetched / skipped  search_viable_spots と同じ
+      plans          検索中に得た予報から採点した (スポット, 到着する時間) の上位 top_n 件
+    """
+    now = time.time() if now is None else now
+    nearby_spots = find_nearby_spots(catalog, latitude, longitude, radius_km)
+    forecasts = {}
+
+    def fetch_spot(spot):
+        forecast = fetch(spot["lat"], spot["lon"])
+        forecasts[spot["index"]] = forecast
+        return forecast
+
+    result = search_viable_spots(
+        nearby_spots, fetch_spot, desired_sqm, desired_cloud_cover,
+        top_n=top_n, lazy=lazy, max_workers=max_workers,
+    )
+
+    sky = tonight_events(catalog, now)
+    viable_spots = []
+    for spot in result["viable_spots"][:top_n]:
+        i = spot["index"]
+        viable_spots.append({
+            "index": i,
+            "name": spot["name"],
+            "lat": spot["lat"],
+            "lon": spot["lon"],
+            "distance_km": round(spot["distance"], 1),
+            "sqm_level": spot["base_sqm"],
+            "cloudiness": spot["cloudiness"],
+            "observed_at": spot["forecast"].observed_at,
+            "moonrise": _timestamp(sky["moonrise"][i]),
+            "moonset": _timestamp(sky["moonset"][i]),
+            "dusk": _timestamp(sky["dusk"][i]),
+            "dawn": _timestamp(sky["dawn"][i]),
+        })
+
+    dark_spots = [spot for spot in nearby_spots if spot["index"] in forecasts]
+    plans = rank_windows(
+        dark_spots, [forecasts[spot["index"]] for spot in dark_spots], now,
+        desired_cloud_cover=desired_cloud_cover, top_n=top_n, horizon_hours=horizon_hours,
+    )
+    return {
+        "candidates": len(nearby_spots),
+        "viable_spots": viable_spots,
+        "unknown_spots": [spot["name"] for spot in result["unknown_spots"]],
+        "fetched": result["fetched"],
+        "skipped": result["skipped"],
+        "plans": [
+            {
+                "index": plan["index"],
+                "name": plan["name"],
+                "arrival_slot": plan["arrival_slot"],
+                "score": round(plan["score"], 4),
+                "clouds": plan["clouds"],
+                "moon_up": plan["moon_up"],
+                "distance_km": round(plan["distance"], 1),
+            }
+            for plan in plans
+        ],
+    }
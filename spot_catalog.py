@@ -0,0 +1,76 @@
+import csv
+import os
+
+import numpy as np
+
+from spot_index import SpotIndex
+
+# --- 観測地カタログ ---
+# カタログを更新するときは新しい版のファイル（spots_v2.csv など）を追加してここを切り替える
+CATALOG_VERSION = 1
+DEFAULT_CATALOG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", f"spots_v{CATALOG_VERSION}.csv"
+)
+
+# 空の暗さを 0〜1 に揃えるときの SQM 値の範囲（先読みの優先度と「いつ・どこ」の採点で共有する）
+SQM_MIN, SQM_MAX = 15.0, 22.0
+
+
+def sqm_darkness(sqm_levels):
+    """SQM 値を 0（SQM_MIN 以下）〜 1（SQM_MAX 以上）の暗さに揃える。"""
+    return np.clip((np.asarray(sqm_levels, dtype=np.float64) - SQM_MIN) / (SQM_MAX - SQM_MIN), 0.0, 1.0)
+
+
+def _frozen(values, dtype):
+    array = np.array(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+class SpotCatalog:
+    """観測地カタログ。変更できない列ごとの配列として持つ。
+
+    lats / lons / sqm_levels は同じ長さの float 配列、names / regions は
+    文字列のタプルで、i 番目の要素が i 番目の観測地を表す。
+    検索ごとの値（距離など）はここには書き込まず、検索結果の側で持つ。
+    """
+
+    __slots__ = ("version", "names", "regions", "lats", "lons", "sqm_levels", "index")
+
+    def __init__(self, names, regions, lats, lons, sqm_levels, version=CATALOG_VERSION):
+        self.version = version
+        self.names = tuple(names)
+        self.regions = tuple(regions)
+        self.lats = _frozen(lats, np.float64)
+        self.lons = _frozen(lons, np.float64)
+        self.sqm_levels = _frozen(sqm_levels, np.float64)
+        if not (len(self.names) == len(self.regions) == len(self.lats) == len(self.lons) == len(self.sqm_levels)):
+            raise ValueError("catalog columns must have the same length")
+        self.index = SpotIndex(self.lats, self.lons)
+
+    @classmethod
+    def load(cls, path=DEFAULT_CATALOG_PATH, version=CATALOG_VERSION):
+        """name, region, lat, lon, sqm_level の列を持つ CSV から読み込む。"""
+        names, regions, lats, lons, sqm_levels = [], [], [], [], []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                names.append(row["name"])
+                regions.append(row["region"])
+                lats.append(float(row["lat"]))
+                lons.append(float(row["lon"]))
+                sqm_levels.append(float(row["sqm_level"]))
+        return cls(names, regions, lats, lons, sqm_levels, version=version)
+
+    def __len__(self):
+        return len(self.names)
+
+    def spot(self, i, **extra):
+        """i 番目の観測地を、検索結果で使う辞書として新しく作って返す。"""
+        return {
+            "index": int(i),
+            "name": self.names[i],
+            "lat": float(self.lats[i]),
+            "lon": float(self.lons[i]),
+            "sqm_level": float(self.sqm_levels[i]),
+            **extra,
+        }
@@ -0,0 +1,77 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# 緯度1度あたりの距離（km）
+KM_PER_DEG_LAT = np.pi * EARTH_RADIUS_KM / 180
+
+
+def to_unit_vectors(lats, lons):
+    """緯度経度（度）を単位球面上の (x, y, z) に変換する。"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def haversine_km(lat, lon, lats, lons):
+    """1地点から複数地点への大円距離（km）をまとめて計算する。"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _chord_to_km(chord):
+    # 単位球面上の弦の長さ -> 大円距離
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+
+class SpotIndex:
+    """観測地カタログの空間インデックス。
+
+    地点を緯度順に並べた単位ベクトルとして保持し、
+    半径検索は緯度の帯で候補を絞ってから、k 近傍検索は全件に対して、
+    それぞれ NumPy で一度に距離を計算する。
+    返すインデックスは元のカタログでの位置。
+    """
+
+    def __init__(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self._order = np.argsort(lats, kind="stable")
+        self._lats = lats[self._order]
+        self._vectors = to_unit_vectors(self._lats, lons[self._order])
+
+    @classmethod
+    def from_spots(cls, spots):
+        return cls([spot["lat"] for spot in spots], [spot["lon"] for spot in spots])
+
+    def __len__(self):
+        return len(self._order)
+
+    def _distances(self, latitude, longitude, start=0, stop=None):
+        origin = to_unit_vectors(latitude, longitude)
+        chord = np.linalg.norm(self._vectors[start:stop] - origin, axis=1)
+        return _chord_to_km(chord)
+
+    def query_radius(self, latitude, longitude, radius_km):
+        """半径 radius_km 以内の地点を近い順に (インデックス, 距離km) で返す。"""
+        delta = radius_km / KM_PER_DEG_LAT
+        start = np.searchsorted(self._lats, latitude - delta, side="left")
+        stop = np.searchsorted(self._lats, latitude + delta, side="right")
+        distances = self._distances(latitude, longitude, start, stop)
+        hits = np.flatnonzero(distances <= radius_km)
+        hits = hits[np.argsort(distances[hits], kind="stable")]
+        return self._order[start + hits], distances[hits]
+
+    def query_nearest(self, latitude, longitude, k):
+        """近い順に k 件の地点を (インデックス, 距離km) で返す。"""
+        distances = self._distances(latitude, longitude)
+        k = min(k, len(distances))
+        if k <= 0:
+            return self._order[:0], distances[:0]
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        return self._order[nearest], distances[nearest]
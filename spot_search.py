@@ -0,0 +1,136 @@
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from weather_client import MAX_WORKERS
+
+# --- 検索の既定値 ---
+SEARCH_RADIUS_KM = 500
+DEFAULT_TOP_N = 3
+# 車での平均移動速度（km/h）
+AVG_SPEED_KMH = 40
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    R = 6371
+    dLat = math.radians(lat2 - lat1)
+    dLon = math.radians(lon2 - lon1)
+    a = math.sin(dLat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def estimate_travel_hours(distance_km):
+    return distance_km / AVG_SPEED_KMH
+
+
+def find_nearby_spots(catalog, latitude, longitude, radius_km=SEARCH_RADIUS_KM):
+    """半径 radius_km 以内のスポットを、距離を付けて近い順に返す。
+
+    返す辞書は検索ごとに新しく作るので、カタログ（SpotCatalog）は変更されない。
+    """
+    indices, distances = catalog.index.query_radius(latitude, longitude, radius_km)
+    return [catalog.spot(i, distance=float(distance)) for i, distance in zip(indices, distances)]
+
+
+def iter_search(nearby_spots, fetch, desired_sqm, desired_cloud_cover,
+                top_n=DEFAULT_TOP_N, lazy=True, max_workers=MAX_WORKERS):
+    """条件（SQM・雲量）に合うスポットを近い順に探し、途中経過を順次 yield する。
+
+    fetch(spot) は Forecast（失敗時は None）を返す関数。天気は近い順に
+    最大 max_workers 件ずつ並列に問い合わせ、届いた順に次の辞書を返す。
+      {"kind": "spot", "status": "viable" | "cloudy" | "unknown",
+       "spot": ..., "resolved": 調べ終えた数, "total": 調べる予定の数}
+    最後に search_viable_spots と同じ形の結果を {"kind": "done", ...} で返す。
+
+    lazy=True のときは、近い順に top_n 件の条件に合うスポットが確定した
+    （それより近い候補地をすべて調べ終えた）時点で打ち切る。また、近い側から
+    途切れずに調べ終えた位置より max_workers 件先までしか問い合わせず、条件に合う
+    スポットが top_n 件見つかった後はそれより遠い候補地を問い合わせない
+    （近くの1件の応答が遅くても、遠くの候補地へ問い合わせを広げない）。
+    """
+    candidates = [spot for spot in nearby_spots if spot.get("sqm_level", 0) >= desired_sqm]
+    candidates.sort(key=lambda x: x["distance"])
+    total = len(candidates)
+    statuses = [None] * total
+    viable_spots = []
+    unknown_spots = []
+    resolved = 0
+    # 近い側から途切れずに調べ終えた数と、その中の条件に合う数
+    prefix = 0
+    prefix_viable = 0
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, total)))
+    pending = {}
+    next_index = 0
+    try:
+        while next_index < total or pending:
+            while next_index < total and len(pending) < max_workers:
+                if lazy and (next_index >= prefix + max_workers or len(viable_spots) >= top_n):
+                    break
+                pending[executor.submit(fetch, candidates[next_index])] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=pending.get):
+                i = pending.pop(future)
+                spot = candidates[i]
+                try:
+                    forecast = future.result()
+                except Exception:
+                    forecast = None
+                resolved += 1
+                if forecast is None:
+                    status = "unknown"
+                    unknown_spots.append(spot)
+                elif forecast.current_clouds > desired_cloud_cover:
+                    status = "cloudy"
+                else:
+                    status = "viable"
+                    spot = {
+                        "index": spot["index"], "name": spot["name"], "lat": spot["lat"], "lon": spot["lon"],
+                        "distance": spot["distance"], "base_sqm": spot["sqm_level"],
+                        "cloudiness": forecast.current_clouds,
+                        "forecast": forecast
+                    }
+                    viable_spots.append(spot)
+                statuses[i] = status
+                yield {"kind": "spot", "status": status, "spot": spot, "resolved": resolved, "total": total}
+
+            while prefix < total and statuses[prefix] is not None:
+                prefix_viable += statuses[prefix] == "viable"
+                prefix += 1
+            if lazy and prefix_viable >= top_n:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    viable_spots.sort(key=lambda x: x["distance"])
+    unknown_spots.sort(key=lambda x: x["distance"])
+    if lazy:
+        viable_spots = viable_spots[:top_n]
+    yield {
+        "kind": "done",
+        "viable_spots": viable_spots,
+        "unknown_spots": unknown_spots,
+        "fetched": resolved,
+        "skipped": total - resolved,
+    }
+
+
+def search_viable_spots(nearby_spots, fetch, desired_sqm, desired_cloud_cover,
+                        top_n=DEFAULT_TOP_N, lazy=True, max_workers=MAX_WORKERS):
+    """条件（SQM・雲量）に合うスポットを近い順に探す（iter_search の結果だけを返す版）。
+
+    lazy=True のときは近い順に天気を調べ、条件に合うスポットが top_n 件
+    確定した時点で打ち切る。lazy=False のときはすべての候補地を調べる
+    （見つかった総数が必要な場合）。
+
+    戻り値の辞書:
+      viable_spots  条件に合ったスポット（近い順）
+      unknown_spots 天気情報を取得できなかったスポット
+      fetched       天気を問い合わせた候補地の数
+      skipped       打ち切りによって問い合わせずに済んだ候補地の数
+    """
+    for event in iter_search(nearby_spots, fetch, desired_sqm, desired_cloud_cover,
+                             top_n=top_n, lazy=lazy, max_workers=max_workers):
+        if event["kind"] == "done":
+            return {key: value for key, value in event.items() if key != "kind"}
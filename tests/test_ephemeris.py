@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from ephemeris import night_start, tonight_events
+from spot_catalog import SpotCatalog
+
+JST = timezone(timedelta(hours=9))
+
+
+def jst(*args):
+    return datetime(*args, tzinfo=JST).timestamp()
+
+
+def test_morning_after_dawn_shows_the_coming_night():
+    catalog = SpotCatalog.load()
+    now = jst(2026, 1, 15, 8, 0)
+    events = tonight_events(catalog, now)
+    # 08:00 はどの観測地でも夜明け後なので、その日の夕方からの夜を表示する
+    assert np.all(events["dusk"] > now)
+    assert np.all(events["dusk"] < jst(2026, 1, 15, 21, 0))
+    assert np.all(events["dawn"] > jst(2026, 1, 16, 4, 0))
+
+
+def test_before_dawn_keeps_the_current_night():
+    catalog = SpotCatalog.load()
+    now = jst(2026, 1, 15, 2, 0)
+    events = tonight_events(catalog, now)
+    assert np.all(events["dusk"] < now)
+    assert np.all(events["dawn"] > now)
+    assert night_start(now) == jst(2026, 1, 14, 12, 0)
+
+
+def test_evening_uses_the_night_that_starts_today():
+    catalog = SpotCatalog.load()
+    now = jst(2026, 1, 15, 20, 0)
+    events = tonight_events(catalog, now)
+    assert np.all(events["dawn"] > now)
+    assert np.all(events["dusk"] > jst(2026, 1, 15, 12, 0))
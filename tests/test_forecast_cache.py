@@ -0,0 +1,48 @@
+import threading
+import time
+
+from forecast import Forecast
+from forecast_cache import ForecastCache, SQLiteBackend
+
+
+def make_forecast(clouds=10):
+    return Forecast(int(time.time()), clouds, int(time.time()), [clouds] * 48)
+
+
+def test_other_process_waits_for_the_claimed_fetch(tmp_path):
+    path = str(tmp_path / "forecasts.sqlite3")
+    # 別々の SQLiteBackend は別のプロセスと同じく、持ち主の違う claim を取る
+    first = ForecastCache(SQLiteBackend(path))
+    second = ForecastCache(SQLiteBackend(path))
+    started = threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append("first")
+        started.set()
+        time.sleep(0.3)
+        return make_forecast(10)
+
+    def second_loader():
+        calls.append("second")
+        return make_forecast(90)
+
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("first", first.get(35.0, 139.0, slow_loader)))
+    thread.start()
+    started.wait(5)
+    results["second"] = second.get(35.0, 139.0, second_loader)
+    thread.join()
+
+    assert calls == ["first"]
+    assert results["second"].current_clouds == 10
+    assert second.stats()["claim_waits"] == 1
+
+
+def test_claim_is_released_after_a_failed_fetch(tmp_path):
+    path = str(tmp_path / "forecasts.sqlite3")
+    first = ForecastCache(SQLiteBackend(path))
+    second = ForecastCache(SQLiteBackend(path))
+    assert first.get(35.0, 139.0, lambda: None) is None
+    assert second.get(35.0, 139.0, lambda: make_forecast(30)).current_clouds == 30
+
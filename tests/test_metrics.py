@@ -0,0 +1,33 @@
+import json
+import logging
+
+from metrics import Metrics
+
+
+def test_request_log_is_emitted_at_info_without_extra_setup(caplog):
+    # caplog.set_level は使わない。有効にしただけで INFO の記録が出ること
+    metrics = Metrics(enabled=True)
+    trace = {}
+    with metrics.span("distance_scan", trace):
+        pass
+    metrics.log_request(trace, candidates=3)
+
+    records = [r for r in caplog.records if r.name == "hoshidoko.metrics"]
+    assert len(records) == 1
+    assert records[0].levelno == logging.INFO
+    record = json.loads(records[0].getMessage())
+    assert record["event"] == "search"
+    assert record["candidates"] == 3
+    assert "distance_scan" in record["spans_ms"]
+
+
+def test_disabled_metrics_record_nothing(caplog):
+    metrics = Metrics()
+    trace = {}
+    with metrics.span("distance_scan", trace):
+        pass
+    metrics.incr("searches")
+    metrics.log_request(trace)
+    assert trace == {}
+    assert metrics.snapshot() == {"counters": {}, "spans": {}}
+    assert not [r for r in caplog.records if r.name == "hoshidoko.metrics"]
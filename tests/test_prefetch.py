@@ -0,0 +1,57 @@
+import time
+
+from forecast import Forecast
+from forecast_cache import ForecastCache, MemoryBackend
+from prefetch import PrefetchScheduler
+from spot_catalog import SpotCatalog
+from weather_client import DailyQuota
+
+
+def make_scheduler(daily_budget, quota):
+    catalog = SpotCatalog.load()
+    calls = []
+
+    def fetch(latitude, longitude):
+        calls.append((latitude, longitude))
+        quota.try_consume()
+        return Forecast(int(time.time()), 10, int(time.time()), [10] * 48)
+
+    scheduler = PrefetchScheduler(catalog, ForecastCache(MemoryBackend()), fetch,
+                                  daily_budget=daily_budget, interval=86400, quota=quota)
+    return scheduler, calls
+
+
+def test_prefetch_leaves_interactive_share_of_shared_quota():
+    quota = DailyQuota(100)
+    # 検索で既に 15 回使った。先読みは残り 85 回のうち、検索用の 20 回を残して 65 回まで
+    for _ in range(15):
+        quota.try_consume()
+    scheduler, calls = make_scheduler(daily_budget=80, quota=quota)
+    scheduler.run_once()
+    assert len(calls) == 65
+    assert quota.remaining() == 20
+    assert scheduler.run_once() == 0
+
+
+def test_prefetch_without_interactive_use_stops_at_daily_budget():
+    quota = DailyQuota(100)
+    scheduler, calls = make_scheduler(daily_budget=80, quota=quota)
+    scheduler.run_once()
+    assert len(calls) == 80
+    assert quota.remaining() == 20
+
+
+def test_status_counts_warm_spots_once_per_cycle():
+    quota = DailyQuota(100)
+    scheduler, _ = make_scheduler(daily_budget=80, quota=quota)
+    scans = []
+    fetched_times = scheduler.cache.fetched_times
+    scheduler.cache.fetched_times = lambda: scans.append(1) or fetched_times()
+
+    assert scheduler.status()["warm_spots"] == 0
+    assert scheduler.status()["warm_spots"] == 0
+    assert len(scans) == 1
+    # 先読みで取り直した分は数え直さずに反映する
+    refreshed = scheduler.run_once()
+    assert scheduler.status()["warm_spots"] == refreshed == 80
+    assert len(scans) == 2
@@ -0,0 +1,52 @@
+import threading
+
+from forecast import Forecast
+from spot_search import search_viable_spots
+
+
+def make_spots(n):
+    return [
+        {"index": i, "name": f"spot-{i}", "lat": 35.0 + i * 0.01, "lon": 139.0,
+         "sqm_level": 21.0, "distance": float(i)}
+        for i in range(n)
+    ]
+
+
+def stalling_fetch(clouds_by_index, release_after=0.3):
+    """先頭の候補地だけ応答が遅い fetch と、呼ばれた候補地のリストを返す。"""
+    calls = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def fetch(spot):
+        with lock:
+            calls.append(spot["index"])
+        if spot["index"] == 0:
+            release.wait(release_after)
+        return Forecast(0, clouds_by_index(spot["index"]), 0, [])
+
+    return fetch, calls
+
+
+def test_slow_nearest_candidate_does_not_widen_the_search():
+    # 先頭だけが条件に合い、残りはすべて曇り
+    fetch, calls = stalling_fetch(lambda i: 0 if i == 0 else 100)
+    result = search_viable_spots(make_spots(40), fetch, 19.0, 30, top_n=1, max_workers=4)
+    assert [spot["index"] for spot in result["viable_spots"]] == [0]
+    # 先頭の応答を待つ間は、先頭から max_workers 件の範囲しか問い合わせない
+    assert sorted(calls) == [0, 1, 2, 3]
+    assert result["skipped"] == 36
+
+
+def test_no_farther_calls_once_top_n_matches_are_known():
+    fetch, calls = stalling_fetch(lambda i: 0)
+    result = search_viable_spots(make_spots(40), fetch, 19.0, 30, top_n=3, max_workers=8)
+    assert [spot["index"] for spot in result["viable_spots"]] == [0, 1, 2]
+    assert len(calls) <= 8
+
+
+def test_search_all_still_checks_every_candidate():
+    fetch, calls = stalling_fetch(lambda i: 0 if i % 2 else 100, release_after=0.0)
+    result = search_viable_spots(make_spots(20), fetch, 19.0, 30, top_n=3, lazy=False, max_workers=4)
+    assert len(calls) == 20
+    assert len(result["viable_spots"]) == 10
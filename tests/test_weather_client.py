@@ -0,0 +1,96 @@
+import time
+
+import requests
+
+from forecast_cache import SQLiteBackend
+from weather_client import MAX_RETRIES, OpenWeatherClient, SharedDailyQuota, SharedTokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._payload = payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}")
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    """決まった順番でレスポンスを返し、送られたリクエストの数を数える。"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+def onecall_payload():
+    now = int(time.time())
+    return {"current": {"dt": now, "clouds": 20}, "hourly": [{"dt": now, "clouds": 20}]}
+
+
+def test_each_retry_is_charged_to_the_daily_quota():
+    session = FakeSession([
+        FakeResponse(429, headers={"Retry-After": "0"}),
+        FakeResponse(503, headers={"Retry-After": "0"}),
+        FakeResponse(200, onecall_payload()),
+    ])
+    client = OpenWeatherClient("key", session=session, daily_limit=10)
+    forecast = client.fetch(35.0, 139.0)
+    assert forecast is not None and forecast.current_clouds == 20
+    assert session.requests == 3
+    stats = client.stats()
+    assert stats["calls"] == 3
+    assert stats["retries"] == 2
+    assert stats["quota_remaining"] == 7
+
+
+def test_retries_stop_when_quota_runs_out():
+    session = FakeSession([FakeResponse(429, headers={"Retry-After": "0"})] * (MAX_RETRIES + 1))
+    client = OpenWeatherClient("key", session=session, daily_limit=2)
+    assert client.fetch(35.0, 139.0) is None
+    assert session.requests == 2
+    assert client.stats()["quota_remaining"] == 0
+
+
+def test_long_retry_after_is_not_waited_for():
+    session = FakeSession([FakeResponse(429, headers={"Retry-After": "3600"})])
+    client = OpenWeatherClient("key", session=session, daily_limit=10)
+    assert client.fetch(35.0, 139.0) is None
+    assert session.requests == 1
+    assert client.stats()["failures"] == 1
+
+
+def test_client_errors_are_not_retried():
+    session = FakeSession([FakeResponse(401)])
+    client = OpenWeatherClient("key", session=session, daily_limit=10)
+    assert client.fetch(35.0, 139.0) is None
+    assert session.requests == 1
+
+
+def test_daily_quota_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "forecasts.sqlite3")
+    # 別々の SQLiteBackend は別のプロセスと同じく、それぞれの接続で数える
+    a = SharedDailyQuota(SQLiteBackend(path), 3)
+    b = SharedDailyQuota(SQLiteBackend(path), 3)
+    assert a.try_consume() and b.try_consume() and a.try_consume()
+    assert not b.try_consume()
+    assert a.remaining() == b.remaining() == 0
+
+
+def test_token_bucket_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "forecasts.sqlite3")
+    # 1分に2回まで。2つ目のプロセスは1つ目が使った分を引いた残りしか使えない
+    a = SharedTokenBucket(SQLiteBackend(path), 2 / 60, 2)
+    b = SharedTokenBucket(SQLiteBackend(path), 2 / 60, 2)
+    assert a.acquire(timeout=0) and b.acquire(timeout=0)
+    assert not a.acquire(timeout=0)
+    assert not b.acquire(timeout=0)
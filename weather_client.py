@@ -0,0 +1,335 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from forecast import parse_onecall
+from metrics import METRICS
+
+# --- OpenWeather One Call 3.0 への接続設定 ---
+# ベンチマークなどでローカルの代替サーバーを使うときは環境変数で差し替える
+ONECALL_URL = os.environ.get("OPENWEATHER_ONECALL_URL", "https://api.openweathermap.org/data/3.0/onecall")
+# (接続タイムアウト, 読み込みタイムアウト) 秒
+REQUEST_TIMEOUT = (3.05, 10)
+# 同時に投げるリクエストの上限（コネクションプールの大きさも揃える）
+MAX_WORKERS = 8
+# 429 / 5xx は指数バックオフで再試行する（0.5s, 1s, 2s ...）。
+# 再試行も1回の呼び出しとして課金されるので、OpenWeatherClient が制限を通して送り直す
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# One Call 3.0（One Call by Call）の利用制限。プランに合わせて変更する
+CALLS_PER_MINUTE = 60
+DAILY_CALL_LIMIT = 1000
+# トークンが空いたときに待つ最長時間（秒）。これを超えたら取得をあきらめる
+RATE_LIMIT_WAIT = 5.0
+
+
+def create_session(pool_size=MAX_WORKERS):
+    """再試行とコネクションプールを設定した requests.Session を作る。
+
+    ここで再試行するのは、サーバーに届かず課金されない接続の失敗だけ。
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=0,
+        status=0,
+        backoff_factor=BACKOFF_FACTOR,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _retry_after(response, attempt):
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return BACKOFF_FACTOR * 2 ** attempt
+
+
+def request_onecall(session, latitude, longitude, api_key, timeout=REQUEST_TIMEOUT, url=ONECALL_URL, attempt=0):
+    """One Call API に HTTP リクエストを1回だけ送り、(JSON, 再試行までの秒数) を返す。
+
+    成功したときは (JSON, None)。429 / 5xx / 通信エラーのときは (None, 待つ秒数)
+    （Retry-After があればその値、なければ attempt 回目の指数バックオフ）。
+    再試行しても変わらない失敗（401 など）は (None, None)。
+    """
+    params = {
+        "lat": latitude,
+        "lon": longitude,
+        # 月の出入りは ephemeris.py で計算するので daily は受け取らない
+        "exclude": "minutely,alerts,daily",
+        "appid": api_key,
+        "lang": "ja",
+        "units": "metric",
+    }
+    try:
+        response = session.get(url, params=params, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return None, _retry_after(None, attempt)
+    if response.status_code in RETRY_STATUSES:
+        return None, _retry_after(response, attempt)
+    try:
+        response.raise_for_status()
+        return response.json(), None
+    except (requests.exceptions.RequestException, ValueError):
+        return None, None
+
+
+def fetch_all(items, fetch, max_workers=MAX_WORKERS):
+    """items の各要素に fetch を並列に適用し、同じ順番で結果を返す。
+
+    fetch が例外を投げた要素は None（天気不明）として扱い、結果から落とさない。
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def safe_fetch(item):
+        try:
+            return fetch(item)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(safe_fetch, items))
+
+
+class TokenBucket:
+    """プロセス全体で共有するトークンバケット。rate 個/秒で補充され、最大 capacity 個まで貯まる。"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """トークンを1つ取る。timeout 秒以内に取れなければ False を返す。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket:
+    """同じ SQLite ファイル（forecast_cache.SQLiteBackend）を使うすべてのプロセスで共有する TokenBucket。
+
+    1分あたりの上限を API キーを使う全プロセスで守るため、残りのトークンを
+    backend の rate_limits テーブルに name ごとの1行として持つ。
+    """
+
+    def __init__(self, backend, rate, capacity, name="onecall"):
+        self.backend = backend
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+
+    def acquire(self, timeout=None):
+        """トークンを1つ取る。timeout 秒以内に取れなければ False を返す。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.backend.take_token(self.name, self.rate, self.capacity)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class DailyQuota:
+    """1日（UTC）あたりの呼び出し回数を数える。上限に達したら try_consume() が False を返す。"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._day = None
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        today = datetime.now(timezone.utc).date()
+        if today != self._day:
+            self._day = today
+            self.used = 0
+
+    def try_consume(self):
+        with self._lock:
+            self._roll()
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def remaining(self):
+        with self._lock:
+            self._roll()
+            return max(self.limit - self.used, 0)
+
+
+class SharedDailyQuota:
+    """同じ SQLite ファイル（forecast_cache.SQLiteBackend）を使うすべてのプロセスで共有する DailyQuota。
+
+    プロセスごとに上限を分けると、負荷の偏りで全体の枠が余るので、
+    1日（UTC）ごとの使用回数を backend の api_usage テーブルで数える。
+    """
+
+    def __init__(self, backend, limit):
+        self.backend = backend
+        self.limit = limit
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def try_consume(self):
+        return self.backend.consume_call(self._today(), self.limit)
+
+    def remaining(self):
+        return max(self.limit - self.backend.calls_on(self._today()), 0)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーへの同時呼び出しをまとめ、実際の呼び出しは1回だけにする。"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """fn() の結果と、他の呼び出しの結果を共有したかどうかを返す。"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+class OpenWeatherClient:
+    """サーバー内のすべてのセッションで共有する One Call API クライアント。
+
+    同じ地点への同時リクエストは1回にまとめ、トークンバケットで
+    1分あたりの呼び出し数を、DailyQuota で1日の呼び出し数を制限する。
+    429 / 5xx の再試行も1回ずつトークンと DailyQuota を使い、calls に数える。
+    quota に SharedDailyQuota を、bucket に SharedTokenBucket を渡すと、
+    1日・1分あたりの上限を他のプロセスと共有する。
+    レスポンスは Forecast に変換して返す。
+    制限に達した場合や取得に失敗した場合は None を返すので、
+    呼び出し側は保存済みの予報で代用する。
+    """
+
+    def __init__(self, api_key, session=None, calls_per_minute=CALLS_PER_MINUTE,
+                 daily_limit=DAILY_CALL_LIMIT, rate_limit_wait=RATE_LIMIT_WAIT, url=ONECALL_URL,
+                 quota=None, bucket=None):
+        self.api_key = api_key
+        self.url = url
+        self.session = session if session is not None else create_session()
+        self.bucket = bucket if bucket is not None else TokenBucket(calls_per_minute / 60, calls_per_minute)
+        self.quota = quota if quota is not None else DailyQuota(daily_limit)
+        self.rate_limit_wait = rate_limit_wait
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "coalesced": 0, "throttled": 0, "quota_rejected": 0, "failures": 0,
+                          "retries": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["quota_remaining"] = self.quota.remaining()
+        stats["daily_limit"] = self.quota.limit
+        return stats
+
+    @property
+    def quota_exhausted(self):
+        return self.quota.remaining() <= 0
+
+    def fetch(self, latitude, longitude):
+        key = f"{latitude:.4f},{longitude:.4f}"
+        payload, shared = self._flight.do(key, lambda: self._call(latitude, longitude))
+        if shared:
+            self._count("coalesced")
+        return payload
+
+    def _acquire(self):
+        """HTTP リクエスト1回分の呼び出し枠を取る。取れなければ False。"""
+        if self.quota_exhausted:
+            self._count("quota_rejected")
+            return False
+        with METRICS.span("rate_limit_wait"):
+            acquired = self.bucket.acquire(timeout=self.rate_limit_wait)
+        if not acquired:
+            self._count("throttled")
+            return False
+        if not self.quota.try_consume():
+            self._count("quota_rejected")
+            return False
+        self._count("calls")
+        return True
+
+    def _call(self, latitude, longitude):
+        payload = None
+        for attempt in range(MAX_RETRIES + 1):
+            if not self._acquire():
+                return None
+            with METRICS.span("onecall_request"):
+                payload, retry_after = request_onecall(
+                    self.session, latitude, longitude, self.api_key, url=self.url, attempt=attempt,
+                )
+            # 待ち時間が長すぎる場合は再試行せず、保存済みの予報に任せる
+            if retry_after is None or attempt == MAX_RETRIES or retry_after > self.rate_limit_wait:
+                break
+            self._count("retries")
+            time.sleep(retry_after)
+        forecast = parse_onecall(payload) if payload is not None else None
+        if forecast is None:
+            self._count("failures")
+        return forecast